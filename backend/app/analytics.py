@@ -0,0 +1,157 @@
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from pymongo import UpdateOne
+from .database import (
+    analytics_daily_collection, analytics_dirty_collection, analytics_purged_collection,
+    appointment_archive_collection, appointment_bucket_collection, appointment_collection
+)
+from .availability import day_key
+from .jobs import acquire_lease, release_lease
+from . import slot_buckets
+
+# Dzienne rollupy per lekarz: {doctor_id, date, slots, available, booked, completed,
+# cancellations, lead_time_hours_sum, lead_time_count, refreshed_at}
+JOB_ID = "appointments_daily"
+REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", 300))
+# Zapisy z updated_at tuż przed "teraz" mogą jeszcze nie być widoczne - znacznik trzyma ten margines
+WATERMARK_LAG_SECONDS = float(os.getenv("ANALYTICS_WATERMARK_LAG_SECONDS", 5))
+KEYS_PER_BATCH = int(os.getenv("ANALYTICS_KEYS_PER_BATCH", 500))
+LEASE_SECONDS = float(os.getenv("ANALYTICS_LEASE_SECONDS", 600))
+
+Key = Tuple[object, datetime]
+
+async def record_purged(slots: Iterable[dict]) -> None:
+    # Usunięte wolne sloty nadal liczą się do pojemności dnia - inaczej wykorzystanie przeszłych dni rośnie do 100%
+    counts = Counter((slot["doctor_id"], day_key(slot["start_time"])) for slot in slots)
+    if counts:
+        await analytics_purged_collection.bulk_write([
+            UpdateOne({"doctor_id": doctor_id, "start_time": day}, {"$inc": {"purged": count}}, upsert=True)
+            for (doctor_id, day), count in counts.items()
+        ], ordered=False)
+
+async def mark_dirty(documents: Iterable[dict]) -> None:
+    # Usunięte lub przeniesione wizyty nie mają już updated_at w starym dniu - zapamiętujemy ten dzień
+    operations = [
+        UpdateOne(
+            {"doctor_id": doc["doctor_id"], "date": day_key(doc["start_time"])},
+            {"$set": {"marked_at": datetime.utcnow()}},
+            upsert=True
+        )
+        for doc in documents
+    ]
+    if operations:
+        await analytics_dirty_collection.bulk_write(operations, ordered=False)
+
+async def _changed_keys(since: Optional[datetime], until: datetime) -> List[Key]:
+    # Bez znacznika (pierwsze uruchomienie) przeliczamy wszystko, także wizyty sprzed updated_at
+    match = {"updated_at": {"$gt": since, "$lte": until}} if since is not None else {}
+    if slot_buckets.BUCKETED:
+        # Kubełek to dokładnie jeden klucz (lekarz, dzień) - updated_at zmienia się przy każdej zmianie slotu
+        buckets = appointment_bucket_collection.find(match, {"doctor_id": 1, "date": 1})
+        return [(bucket["doctor_id"], bucket["date"]) async for bucket in buckets]
+    keys = await appointment_collection.aggregate([
+        {"$match": match},
+        {"$group": {"_id": {
+            "doctor_id": "$doctor_id",
+            "date": {"$dateTrunc": {"date": "$start_time", "unit": "day"}},
+        }}},
+    ]).to_list(None)
+    return [(key["_id"]["doctor_id"], key["_id"]["date"]) for key in keys]
+
+def _rollup_pipeline(keys: List[Key], run_at: datetime) -> list:
+    match = {"$match": {"$or": [
+        {"doctor_id": doctor_id, "start_time": {"$gte": day, "$lt": day + timedelta(days=1)}}
+        for doctor_id, day in keys
+    ]}}
+    source = [match]
+    if slot_buckets.BUCKETED:
+        source = [
+            {"$match": {"$or": [{"doctor_id": doctor_id, "date": day} for doctor_id, day in keys]}},
+            *slot_buckets.FLATTEN,
+        ]
+    return [
+        *source,
+        # Wizyty przeniesione do archiwum nadal liczą się do statystyk swojego dnia
+        {"$unionWith": {"coll": appointment_archive_collection.name, "pipeline": [match]}},
+        # Usunięte niezarezerwowane sloty z przeszłości: {doctor_id, start_time (dzień), purged}
+        {"$unionWith": {"coll": analytics_purged_collection.name, "pipeline": [match]}},
+        {"$group": {
+            "_id": {
+                "doctor_id": "$doctor_id",
+                "date": {"$dateTrunc": {"date": "$start_time", "unit": "day"}},
+            },
+            "slots": {"$sum": {"$ifNull": ["$purged", 1]}},
+            "available": {"$sum": {"$cond": [{"$eq": ["$status", "available"]}, 1, {"$ifNull": ["$purged", 0]}]}},
+            "booked": {"$sum": {"$cond": [{"$eq": ["$status", "booked"]}, 1, 0]}},
+            "completed": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}},
+            "cancellations": {"$sum": {"$ifNull": ["$cancellations", 0]}},
+            # Czas od rezerwacji do wizyty - tylko dla slotów z zapisanym booked_at
+            "lead_time_minutes": {"$sum": {"$cond": [
+                {"$and": [{"$in": ["$status", ["booked", "completed"]]}, {"$eq": [{"$type": "$booked_at"}, "date"]}]},
+                {"$dateDiff": {"startDate": "$booked_at", "endDate": "$start_time", "unit": "minute"}},
+                0
+            ]}},
+            "lead_time_count": {"$sum": {"$cond": [
+                {"$and": [{"$in": ["$status", ["booked", "completed"]]}, {"$eq": [{"$type": "$booked_at"}, "date"]}]}, 1, 0
+            ]}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "doctor_id": "$_id.doctor_id",
+            "date": "$_id.date",
+            "slots": 1, "available": 1, "booked": 1, "completed": 1, "cancellations": 1,
+            "lead_time_hours_sum": {"$divide": ["$lead_time_minutes", 60]},
+            "lead_time_count": 1,
+            "refreshed_at": {"$literal": run_at},
+        }},
+        {"$merge": {
+            "into": analytics_daily_collection.name,
+            "on": ["doctor_id", "date"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+async def _refresh_keys(keys: List[Key], run_at: datetime) -> None:
+    for i in range(0, len(keys), KEYS_PER_BATCH):
+        chunk = keys[i:i + KEYS_PER_BATCH]
+        source = appointment_bucket_collection if slot_buckets.BUCKETED else appointment_collection
+        await source.aggregate(_rollup_pipeline(chunk, run_at)).to_list(None)
+        # Dni, w których nie została żadna wizyta, nie trafiły do $merge - usuwamy ich stare rollupy
+        await analytics_daily_collection.delete_many({
+            "$or": [{"doctor_id": doctor_id, "date": day} for doctor_id, day in chunk],
+            "refreshed_at": {"$ne": run_at},
+        })
+
+async def refresh_rollups(full: bool = False) -> Optional[dict]:
+    state = await acquire_lease(JOB_ID, LEASE_SECONDS)
+    if state is None:
+        return None
+
+    now = datetime.utcnow()
+    try:
+        watermark = None if full else state.get("watermark")
+        until = now - timedelta(seconds=WATERMARK_LAG_SECONDS)
+        run_at = now
+
+        keys = set(await _changed_keys(watermark, until))
+        dirty = await analytics_dirty_collection.find({"marked_at": {"$lte": until}}).to_list(None)
+        keys.update((doc["doctor_id"], doc["date"]) for doc in dirty)
+
+        await _refresh_keys(sorted(keys, key=lambda key: (key[1], str(key[0]))), run_at)
+        if dirty:
+            await analytics_dirty_collection.delete_many({
+                "_id": {"$in": [doc["_id"] for doc in dirty]}, "marked_at": {"$lte": until}
+            })
+
+        await release_lease(JOB_ID, watermark=until, last_run=run_at, last_keys=len(keys))
+        return {"watermark": until, "previous_watermark": watermark, "days_refreshed": len(keys)}
+    except BaseException:
+        await release_lease(JOB_ID)
+        raise
+
+if __name__ == "__main__":
+    print(asyncio.run(refresh_rollups(full=True)))
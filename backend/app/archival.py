@@ -0,0 +1,165 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo import DeleteOne, ReplaceOne, ReturnDocument
+from . import slot_buckets
+from .analytics import mark_dirty, record_purged
+from .availability import day_key, record_changes
+from .database import appointment_archive_collection, appointment_bucket_collection, appointment_collection
+from .jobs import acquire_lease, release_lease, save_state
+from .response_cache import invalidate
+
+# Wizyty zakończone dawniej niż ARCHIVE_AFTER_DAYS trafiają do appointments_archive,
+# a nigdy niezarezerwowane sloty z przeszłości są usuwane
+JOB_ID = "appointments_archive"
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 30))
+PURGE_AFTER_HOURS = int(os.getenv("PURGE_STALE_SLOTS_AFTER_HOURS", 24))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 1000))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", 3600))
+LEASE_SECONDS = float(os.getenv("ARCHIVE_LEASE_SECONDS", 1800))
+
+ARCHIVED_STATUSES = ["booked", "completed"]
+
+async def _record_purge(stale: list) -> None:
+    # Podsumowania dostępności tracą usunięte sloty, a rollupy zachowują je jako niewykorzystaną pojemność
+    await record_changes((doc, None) for doc in stale)
+    await record_purged(stale)
+    await mark_dirty(stale)
+
+async def _copy_to_archive(docs: list) -> None:
+    # Kopia jest idempotentna - przerwana paczka zostanie po prostu powtórzona
+    if docs:
+        await appointment_archive_collection.bulk_write(
+            [ReplaceOne({"_id": doc["_id"]}, {**doc, "archived_at": datetime.utcnow()}, upsert=True) for doc in docs],
+            ordered=False
+        )
+
+async def _archive_batch(cutoff: datetime, after_id) -> tuple:
+    query = {"status": {"$in": ARCHIVED_STATUSES}, "end_time": {"$lt": cutoff}}
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+    batch = await appointment_collection.find(query).sort("_id", 1).limit(ARCHIVE_BATCH_SIZE).to_list(None)
+    if not batch:
+        return 0, 0, 0, None
+
+    await _copy_to_archive(batch)
+    # Usuwamy tylko wizyty w stanie, który został skopiowany (jak kubełki - po updated_at)
+    result = await appointment_collection.bulk_write([
+        DeleteOne({"_id": doc["_id"], "status": doc["status"], "updated_at": doc.get("updated_at")}) for doc in batch
+    ], ordered=False)
+    archived = len(batch)
+    if result.deleted_count < len(batch):
+        # Wizyta zmieniona w międzyczasie zostaje, a jej nieaktualna kopia znika z archiwum -
+        # jeśli nadal się kwalifikuje, następny przebieg zarchiwizuje ją ponownie
+        changed = [doc["_id"] async for doc in appointment_collection.find(
+            {"_id": {"$in": [doc["_id"] for doc in batch]}}, {"_id": 1}
+        )]
+        await appointment_archive_collection.delete_many({"_id": {"$in": changed}})
+        archived -= len(changed)
+    return archived, 0, len(batch), batch[-1]["_id"]
+
+async def _archive_bucket_batch(cutoff: datetime, after_id) -> tuple:
+    # Kubełek dnia D zawiera sloty kończące się najpóźniej w dniu D+1 - archiwizujemy całe kubełki
+    query = {"date": {"$lt": day_key(cutoff) - timedelta(days=1)}}
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+    buckets = await appointment_bucket_collection.find(query).sort("_id", 1).limit(ARCHIVE_BATCH_SIZE).to_list(None)
+    if not buckets:
+        return 0, 0, 0, None
+
+    archived = purged = 0
+    for bucket in buckets:
+        slots = [{**slot, "doctor_id": bucket["doctor_id"]} for slot in bucket.get("slots", [])]
+        kept = [slot for slot in slots if slot.get("status") in ARCHIVED_STATUSES]
+        await _copy_to_archive(kept)
+        # Kubełek zmieniony w międzyczasie zostaje - następny przebieg skopiuje go ponownie
+        result = await appointment_bucket_collection.delete_one({"_id": bucket["_id"], "updated_at": bucket.get("updated_at")})
+        if result.deleted_count:
+            stale = [slot for slot in slots if slot.get("status") == "available"]
+            await _record_purge(stale)
+            archived += len(kept)
+            purged += len(stale)
+    return archived, purged, len(buckets), buckets[-1]["_id"]
+
+async def _purge_batch(cutoff: datetime) -> int:
+    stale = await appointment_collection.find(
+        {"status": "available", "end_time": {"$lt": cutoff}}, {"doctor_id": 1, "start_time": 1, "status": 1}
+    ).limit(ARCHIVE_BATCH_SIZE).to_list(None)
+    if not stale:
+        return 0
+    ids = [doc["_id"] for doc in stale]
+    # Warunek powtórzony w delete - slot mógł zostać w międzyczasie zmieniony
+    result = await appointment_collection.delete_many({"_id": {"$in": ids}, "status": "available"})
+    if result.deleted_count < len(stale):
+        remaining = {doc["_id"] async for doc in appointment_collection.find({"_id": {"$in": ids}}, {"_id": 1})}
+        stale = [doc for doc in stale if doc["_id"] not in remaining]
+
+    await _record_purge(stale)
+    return len(stale)
+
+async def _purge_buckets(cutoff: datetime) -> int:
+    condition = {"status": "available", "end_time": {"$lt": cutoff}}
+    buckets = await appointment_bucket_collection.find(
+        {"date": {"$lte": day_key(cutoff)}, "slots": {"$elemMatch": condition}}, {"_id": 1}
+    ).to_list(None)
+    purged = 0
+    for bucket in buckets:
+        # $pull jest atomowy - dokument sprzed zmiany mówi dokładnie, które sloty zostały usunięte
+        before = await appointment_bucket_collection.find_one_and_update(
+            {"_id": bucket["_id"]},
+            {"$pull": {"slots": condition}, "$set": {"updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            continue
+        stale = [
+            {**slot, "doctor_id": before["doctor_id"]} for slot in before.get("slots", [])
+            if slot.get("status") == "available" and slot["end_time"] < cutoff
+        ]
+        await _record_purge(stale)
+        purged += len(stale)
+    return purged
+
+async def archive_appointments() -> Optional[dict]:
+    state = await acquire_lease(JOB_ID, LEASE_SECONDS)
+    if state is None:
+        return None
+
+    now = datetime.utcnow()
+    archived = purged = 0
+    try:
+        # Pozycja (_id) zapisywana po każdej paczce - kolejne uruchomienie wznawia przebieg
+        after_id = state.get("resume_after")
+        archive_batch = _archive_bucket_batch if slot_buckets.BUCKETED else _archive_batch
+        while True:
+            count, stale, fetched, last_id = await archive_batch(now - timedelta(days=ARCHIVE_AFTER_DAYS), after_id)
+            archived += count
+            purged += stale
+            if fetched < ARCHIVE_BATCH_SIZE:
+                # Przebieg zakończony - następny zaczyna od początku kolekcji
+                await save_state(JOB_ID, resume_after=None)
+                break
+            after_id = last_id
+            await save_state(JOB_ID, resume_after=after_id)
+
+        if slot_buckets.BUCKETED:
+            purged += await _purge_buckets(now - timedelta(hours=PURGE_AFTER_HOURS))
+        else:
+            while True:
+                count = await _purge_batch(now - timedelta(hours=PURGE_AFTER_HOURS))
+                purged += count
+                if count < ARCHIVE_BATCH_SIZE:
+                    break
+
+        if archived or purged:
+            invalidate("appointments")
+        report = {"archived": archived, "purged": purged}
+        await release_lease(JOB_ID, last_run=now, last_report=report)
+        return report
+    except BaseException:
+        await release_lease(JOB_ID)
+        raise
+
+if __name__ == "__main__":
+    print(asyncio.run(archive_appointments()))
@@ -2,35 +2,100 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 import os
+import time
 from bson import ObjectId
-from ..database import user_collection
+from ..cache import TTLCache
+from ..crud import users as user_crud
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+# Cache użytkowników (po ID) i już zweryfikowanych tokenów - jeden na proces
+principal_cache = TTLCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60)),
+)
+token_cache = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL_SECONDS", 300)),
+)
+# Moment ostatniej zmiany użytkownika - starsze tokeny nie mogą polegać na claimach.
+# Tylko w tym procesie: inne workery gunicorna ufają claimom do wygaśnięcia tokenu (README).
+_invalidated_at = TTLCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000)),
+    ttl=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60)) * 60,
+)
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+def reset_caches() -> None:
+    principal_cache.reset()
+    token_cache.reset()
+    _invalidated_at.reset()
+
+def invalidate_principal(user_id) -> None:
+    user_id = str(user_id)
+    principal_cache.pop(user_id)
+    _invalidated_at.set(user_id, time.time())
+
+def decode_token(token: str) -> dict:
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
     secret_key = os.getenv("SECRET_KEY", "temporary_dev_secret_key_123")
     algorithm = os.getenv("ALGORITHM", "HS256")
 
-    try: 
+    try:
         payload = jwt.decode(token, secret_key, algorithms=[algorithm])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+
+    ttl = token_cache.ttl
+    if "exp" in payload:
+        ttl = min(ttl, payload["exp"] - time.time())
+    token_cache.set(token, payload, ttl=ttl)
+    return payload
+
+async def load_principal(user_id: str) -> dict:
+    cached = principal_cache.get(user_id)
+    if cached is not None:
+        return dict(cached)
 
     try:
-        user = await user_collection.find_one({"_id": ObjectId(user_id)})
+        user = await user_crud.get(ObjectId(user_id), user_crud.PUBLIC)
     except Exception:
-        raise credentials_exception
+        raise _credentials_exception()
 
     if user is None:
-        raise credentials_exception
-        
-    return user
\ No newline at end of file
+        raise _credentials_exception()
+
+    principal_cache.set(user_id, user)
+    return dict(user)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    payload = decode_token(token)
+    return await load_principal(payload["sub"])
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)):
+    payload = decode_token(token)
+    user_id = payload["sub"]
+
+    invalidated_at = _invalidated_at.get(user_id)
+    claims_fresh = invalidated_at is None or payload.get("iat", 0) > invalidated_at
+
+    if "role" in payload and claims_fresh and ObjectId.is_valid(user_id):
+        return {
+            "_id": ObjectId(user_id),
+            "role": payload["role"],
+            "is_active": payload.get("is_active", True),
+        }
+
+    return await load_principal(user_id)
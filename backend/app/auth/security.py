@@ -1,14 +1,25 @@
+import asyncio
 import bcrypt
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from fastapi import HTTPException, status
 from jose import jwt
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def hash_password(password: str) -> str:
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+HASH_EXECUTOR = os.getenv("HASH_EXECUTOR", "thread")  # thread | process
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", os.cpu_count() or 2))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", 64))
+
+_executor: Executor | None = None
+_slots: asyncio.Semaphore | None = None
+
+def hash_password(password: str, rounds: int | None = None) -> str:
     pwd_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(pwd_bytes, salt)
     return hashed.decode('utf-8')
 
@@ -20,11 +31,62 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     except Exception:
         return False
 
+def needs_rehash(hashed_password: str) -> bool:
+    # Format bcrypt: $2b$<koszt>$<sól+hash>
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+async def _run_hashing(func, *args):
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(HASH_WORKERS + HASH_QUEUE_SIZE)
+
+    if _slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Serwer jest przeciążony, spróbuj ponownie za chwilę"
+        )
+
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), func, *args)
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hashing(hash_password, password, BCRYPT_ROUNDS)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+def reset_hashing_executor() -> None:
+    # W procesie potomnym pula rodzica nie nadaje się do użycia - tylko ją porzucamy
+    global _executor, _slots
+    _executor = None
+    _slots = None
+
+def shutdown_hashing_executor() -> None:
+    global _executor, _slots
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+    _executor = None
+    _slots = None
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire_minutes = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
-    expire = datetime.utcnow() + timedelta(minutes=expire_minutes)
-    to_encode.update({"exp": expire})
+    issued_at = datetime.utcnow()
+    expire = issued_at + timedelta(minutes=expire_minutes)
+    to_encode.update({"exp": expire, "iat": issued_at})
     
     return jwt.encode(
         to_encode, 
@@ -0,0 +1,105 @@
+import asyncio
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Optional
+from pymongo import UpdateOne
+from .database import appointment_bucket_collection, appointment_collection, availability_summary_collection
+
+# Dzienne liczniki slotów per lekarz: {doctor_id, date, available, booked, completed}
+
+def day_key(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, moment.day)
+
+def _increment(doctor_id, day: datetime, changes: dict) -> UpdateOne:
+    return UpdateOne(
+        {"doctor_id": doctor_id, "date": day},
+        {"$inc": changes},
+        upsert=True
+    )
+
+async def record_new_slots(slots: Iterable[dict]) -> None:
+    counts = Counter((slot["doctor_id"], day_key(slot["start_time"]), slot.get("status", "available")) for slot in slots)
+    if not counts:
+        return
+    await availability_summary_collection.bulk_write(
+        [_increment(doctor_id, day, {status: count}) for (doctor_id, day, status), count in counts.items()],
+        ordered=False
+    )
+
+async def record_transition(doctor_id, start_time: datetime, from_status: Optional[str], to_status: Optional[str]) -> None:
+    if from_status == to_status:
+        return
+    changes = {}
+    if from_status:
+        changes[from_status] = -1
+    if to_status:
+        changes[to_status] = 1
+    await availability_summary_collection.update_one(
+        {"doctor_id": doctor_id, "date": day_key(start_time)},
+        {"$inc": changes},
+        upsert=True
+    )
+
+async def record_move(before: dict, after: dict) -> None:
+    before_key = (before["doctor_id"], day_key(before["start_time"]))
+    after_key = (after["doctor_id"], day_key(after["start_time"]))
+    if before_key == after_key:
+        await record_transition(after["doctor_id"], after["start_time"], before.get("status"), after.get("status"))
+        return
+    await availability_summary_collection.bulk_write([
+        _increment(*before_key, {before.get("status", "available"): -1}),
+        _increment(*after_key, {after.get("status", "available"): 1}),
+    ], ordered=False)
+
+async def record_changes(changes: Iterable[tuple]) -> None:
+    # Pary (przed, po); None oznacza brak slotu - wszystko w jednym bulk_write
+    counts = Counter()
+    for before, after in changes:
+        if before is not None:
+            counts[(before["doctor_id"], day_key(before["start_time"]), before.get("status", "available"))] -= 1
+        if after is not None:
+            counts[(after["doctor_id"], day_key(after["start_time"]), after.get("status", "available"))] += 1
+
+    operations = [
+        _increment(doctor_id, day, {status: count})
+        for (doctor_id, day, status), count in counts.items() if count
+    ]
+    if operations:
+        await availability_summary_collection.bulk_write(operations, ordered=False)
+
+async def rebuild_summaries() -> None:
+    # Pełne przeliczenie (np. po wdrożeniu lub ręcznych zmianach w bazie). $merge podmienia dni
+    # w miejscu - czytający nie widzą pustej kolekcji; na końcu usuwamy dni, których już nie ma
+    started = datetime.utcnow()
+    # Import lokalny - slot_buckets korzysta z day_key z tego modułu
+    from . import slot_buckets
+    source, stages = appointment_collection, []
+    if slot_buckets.BUCKETED:
+        source, stages = appointment_bucket_collection, slot_buckets.FLATTEN
+    await source.aggregate([
+        *stages,
+        {"$group": {
+            "_id": {
+                "doctor_id": "$doctor_id",
+                "date": {"$dateTrunc": {"date": "$start_time", "unit": "day"}},
+            },
+            "available": {"$sum": {"$cond": [{"$eq": ["$status", "available"]}, 1, 0]}},
+            "booked": {"$sum": {"$cond": [{"$eq": ["$status", "booked"]}, 1, 0]}},
+            "completed": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}},
+        }},
+        {"$project": {
+            "_id": 0, "doctor_id": "$_id.doctor_id", "date": "$_id.date",
+            "available": 1, "booked": 1, "completed": 1, "rebuilt_at": started,
+        }},
+        {"$merge": {
+            "into": availability_summary_collection.name,
+            "on": ["doctor_id", "date"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]).to_list(None)
+    # Dni z poprzedniego przeliczenia bez żadnego slotu (wpisy z $inc nie mają rebuilt_at)
+    await availability_summary_collection.delete_many({"rebuilt_at": {"$lt": started}})
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_summaries())
@@ -0,0 +1,5 @@
+from typing import List
+from ..database import analytics_daily_read_collection
+
+async def aggregate(pipeline: list) -> List[dict]:
+    return await analytics_daily_read_collection.aggregate(pipeline).to_list(None)
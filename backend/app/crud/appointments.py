@@ -0,0 +1,244 @@
+import heapq
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from fastapi import HTTPException
+from .. import slot_buckets
+from ..database import (
+    appointment_archive_collection, appointment_archive_read_collection, appointment_collection, appointment_read_collection,
+    TRANSACTIONS_UNSUPPORTED, get_client, medical_history_collection
+)
+
+INTERVAL = {"doctor_id": 1, "start_time": 1, "end_time": 1}
+TRANSITION = {"doctor_id": 1, "patient_id": 1, "start_time": 1, "status": 1}
+EXPORTED = ["_id", "start_time", "end_time", "status", "patient_id", "details"]
+LISTED = {"doctor_id": 1, "patient_id": 1, "start_time": 1, "end_time": 1, "status": 1, "details": 1, "created_at": 1}
+
+async def get(appointment_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.find_slot(appointment_id)
+    return await appointment_collection.find_one({"_id": appointment_id}, projection)
+
+async def get_with_archive(appointment_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+    # Wizyty starsze niż ARCHIVE_AFTER_DAYS są już tylko w archiwum
+    appointment = await get(appointment_id, projection)
+    if appointment is None:
+        appointment = await appointment_archive_collection.find_one({"_id": appointment_id}, projection)
+    return appointment
+
+async def get_many(appointment_ids: List[ObjectId]) -> List[dict]:
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.find_slots({"_id": {"$in": appointment_ids}})
+    return await appointment_collection.find({"_id": {"$in": appointment_ids}}).to_list(None)
+
+async def find_overlapping(doctor_id, start: datetime, end: datetime, exclude_id: Optional[ObjectId] = None) -> List[dict]:
+    # doctor_id może być pojedynczym ID albo warunkiem {"$in": [...]}
+    query = {"doctor_id": doctor_id, "start_time": {"$lt": end}, "end_time": {"$gt": start}}
+    if exclude_id is not None:
+        query["_id"] = {"$ne": exclude_id}
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.find_slots(query)
+    return await appointment_collection.find(query, INTERVAL).to_list(None)
+
+async def find_collision(doctor_id: ObjectId, start: datetime, end: datetime, exclude_id: ObjectId) -> Optional[dict]:
+    query = {"_id": {"$ne": exclude_id}, "doctor_id": doctor_id, "start_time": {"$lt": end}, "end_time": {"$gt": start}}
+    if slot_buckets.BUCKETED:
+        found = await slot_buckets.find_slots(query, limit=1)
+        return found[0] if found else None
+    return await appointment_collection.find_one(query, INTERVAL)
+
+async def insert_slots(slots: List[dict]) -> int:
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.insert_slots(slots)
+    result = await appointment_collection.insert_many(slots, ordered=False)
+    return len(result.inserted_ids)
+
+async def update(appointment_id: ObjectId, changes: dict) -> Optional[dict]:
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.update_slot(appointment_id, changes, changes.get("updated_at") or datetime.utcnow())
+    return await appointment_collection.find_one_and_update(
+        {"_id": appointment_id},
+        {"$set": changes},
+        return_document=ReturnDocument.AFTER
+    )
+
+def _unchanged(before: dict) -> dict:
+    # Zapis trafia tylko w dokument w stanie, na podstawie którego go zaplanowano
+    return {"_id": before["_id"], **{field: before.get(field) for field in ("doctor_id", "start_time", "end_time", "status")}}
+
+async def write_batch(items: List[Tuple[dict, Optional[dict]]], now: datetime) -> Tuple[List[bool], Optional[Tuple[int, str]]]:
+    """Zapisuje pary (przed, zmiany) po kolei; zmiany=None oznacza usunięcie.
+
+    Zwraca flagi zastosowania każdej pozycji oraz (indeks, komunikat) błędu, który przerwał paczkę.
+    """
+    # Mongo przechowuje milisekundy - znacznik musi dać się porównać po odczycie
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    operations = [
+        DeleteOne(_unchanged(before)) if changes is None
+        else UpdateOne(_unchanged(before), {"$set": {**changes, "updated_at": now}})
+        for before, changes in items
+    ]
+    if not operations:
+        return [], None
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.write_batch(items, now)
+
+    error = None
+    try:
+        result = await appointment_collection.bulk_write(operations, ordered=True)
+        executed, touched = len(operations), result.matched_count + result.deleted_count
+    except BulkWriteError as exc:
+        first = exc.details["writeErrors"][0]
+        error = (first["index"], first.get("errmsg", "Błąd zapisu"))
+        executed, touched = first["index"], exc.details.get("nMatched", 0) + exc.details.get("nRemoved", 0)
+
+    applied = [i < executed for i in range(len(items))]
+    if touched < executed:
+        # Część dokumentów zmieniła się w międzyczasie - sprawdzamy, które zapisy faktycznie weszły
+        ids = [before["_id"] for before, _ in items[:executed]]
+        present = {
+            doc["_id"]: doc.get("updated_at")
+            async for doc in appointment_collection.find({"_id": {"$in": ids}}, {"updated_at": 1})
+        }
+        for i, (before, changes) in enumerate(items[:executed]):
+            applied[i] = before["_id"] not in present if changes is None else present.get(before["_id"]) == now
+    return applied, error
+
+async def delete(appointment_id: ObjectId) -> Optional[dict]:
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.delete_slot(appointment_id, datetime.utcnow())
+    return await appointment_collection.find_one_and_delete({"_id": appointment_id})
+
+async def book(appointment_id: ObjectId, patient_id: ObjectId, details: dict, now: datetime) -> Optional[dict]:
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.book_slot(appointment_id, patient_id, details, now)
+    return await appointment_collection.find_one_and_update(
+        {"_id": appointment_id, "status": "available"},
+        {"$set": {
+            "patient_id": patient_id,
+            "status": "booked",
+            "details": details,
+            "booked_at": now,
+            "updated_at": now
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def cancel(appointment_id: ObjectId, patient_id: ObjectId, not_before: datetime, now: datetime) -> Optional[dict]:
+    # Własność, status i reguła 24h są częścią filtra - None oznacza, że któryś warunek nie jest spełniony
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.cancel_slot(appointment_id, patient_id, not_before, now)
+    return await appointment_collection.find_one_and_update(
+        {"_id": appointment_id, "patient_id": patient_id, "status": "booked", "start_time": {"$gte": not_before}},
+        {
+            "$set": {
+                "status": "available",
+                "patient_id": None,
+                "details": None,
+                "booked_at": None,
+                "updated_at": now
+            },
+            "$inc": {"cancellations": 1}
+        },
+        projection=TRANSITION,
+        return_document=ReturnDocument.BEFORE
+    )
+
+async def _complete_in(collection, appointment_id: ObjectId, doctor_id: ObjectId, patient_id: ObjectId, now: datetime, session):
+    return await collection.find_one_and_update(
+        {"_id": appointment_id, "doctor_id": doctor_id, "patient_id": patient_id, "status": "booked"},
+        {"$set": {"status": "completed", "updated_at": now}},
+        projection=TRANSITION | {"archived_at": 1},
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+
+async def complete_with_history(appointment_id: ObjectId, doctor_id: ObjectId, history: dict, now: datetime) -> Optional[dict]:
+    # Zmiana statusu i wpis historii w jednej transakcji - nigdy jedno bez drugiego
+    async def complete(session) -> Optional[dict]:
+        patient_id = history["patient_id"]
+        if slot_buckets.BUCKETED:
+            appointment = await slot_buckets.complete_slot(appointment_id, doctor_id, patient_id, now, session)
+        else:
+            appointment = await _complete_in(appointment_collection, appointment_id, doctor_id, patient_id, now, session)
+        if appointment is None:
+            # Zarezerwowana wizyta mogła już trafić do archiwum - tam też można ją zakończyć
+            appointment = await _complete_in(appointment_archive_collection, appointment_id, doctor_id, patient_id, now, session)
+        if appointment is None:
+            return None
+        result = await medical_history_collection.insert_one(history, session=session)
+        history["_id"] = result.inserted_id
+        return appointment
+
+    try:
+        async with await get_client().start_session() as session:
+            return await session.with_transaction(complete)
+    except OperationFailure as exc:
+        if exc.code != TRANSACTIONS_UNSUPPORTED:
+            raise
+        raise HTTPException(
+            status_code=503,
+            detail="Zakończenie wizyty wymaga MongoDB działającej jako replica set (transakcje)"
+        )
+
+def _with_history(hot: List[dict], archived: List[dict], limit: int, direction: int) -> List[dict]:
+    merged = heapq.merge(hot, archived, key=lambda appt: appt["start_time"], reverse=direction == -1)
+    return [appt for _, appt in zip(range(limit), merged)]
+
+async def _list(query: dict, limit: int, direction: int, include_history: bool) -> List[dict]:
+    if slot_buckets.BUCKETED:
+        items = await slot_buckets.find_slots(query, limit=limit, direction=direction)
+    else:
+        items = await appointment_collection.find(query, LISTED).sort("start_time", direction).to_list(limit)
+    if include_history:
+        # Starsze wizyty leżą w archiwum - scalamy oba źródła w kolejności czasu
+        archived = await appointment_archive_read_collection.find(query, LISTED).sort("start_time", direction).to_list(limit)
+        items = _with_history(items, archived, limit, direction)
+    return items
+
+async def list_for_patient(patient_id: ObjectId, limit: int = 100, include_history: bool = False) -> List[dict]:
+    return await _list({"patient_id": patient_id}, limit, -1, include_history)
+
+async def list_for_doctor(doctor_id: ObjectId, limit: int = 500, include_history: bool = False) -> List[dict]:
+    return await _list({"doctor_id": doctor_id}, limit, 1, include_history)
+
+async def page(query: dict, page_filter: dict, limit: int) -> List[dict]:
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.find_slots(query, page_filter, limit)
+    return await appointment_read_collection.find({**query, **page_filter}, LISTED) \
+        .sort([("start_time", 1), ("_id", 1)]) \
+        .limit(limit) \
+        .to_list(length=limit)
+
+async def count(query: dict) -> int:
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.count_slots(query)
+    return await appointment_read_collection.count_documents(query)
+
+async def earliest_available(doctor_ids: Iterable[ObjectId], after: datetime, limit: int) -> List[dict]:
+    query = {"status": "available", "start_time": {"$gt": after}}
+    doctor_ids = list(doctor_ids)
+    query["doctor_id"] = doctor_ids[0] if len(doctor_ids) == 1 else {"$in": doctor_ids}
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.find_slots(query, limit=limit)
+    return await appointment_read_collection.find(query, LISTED) \
+        .sort([("start_time", 1), ("_id", 1)]) \
+        .limit(limit) \
+        .to_list(limit)
+
+async def count_free_by_doctor(doctor_ids: List[ObjectId], after: datetime) -> dict:
+    if slot_buckets.BUCKETED:
+        return await slot_buckets.count_free_by_doctor(doctor_ids, after)
+    rows = appointment_read_collection.aggregate([
+        {"$match": {"doctor_id": {"$in": doctor_ids}, "status": "available", "start_time": {"$gt": after}}},
+        {"$group": {"_id": "$doctor_id", "free_slots": {"$sum": 1}}},
+    ])
+    return {row["_id"]: row["free_slots"] async for row in rows}
+
+def export_cursor(query: dict, batch_size: int):
+    projection = {field: 1 for field in EXPORTED}
+    if slot_buckets.BUCKETED:
+        return slot_buckets.export_cursor(query, projection, batch_size)
+    return appointment_read_collection.find(query, projection).sort("start_time", 1).batch_size(batch_size)
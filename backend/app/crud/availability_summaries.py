@@ -0,0 +1,13 @@
+from datetime import datetime
+from typing import List, Optional
+from bson import ObjectId
+from ..database import availability_summary_read_collection
+
+async def list_for_month(month_start: datetime, month_end: datetime, doctor_id: Optional[ObjectId] = None) -> List[dict]:
+    query = {"date": {"$gte": month_start, "$lt": month_end}}
+    if doctor_id is not None:
+        query["doctor_id"] = doctor_id
+    return await availability_summary_read_collection.find(
+        query,
+        {"_id": 0, "doctor_id": 1, "date": 1, "available": 1, "booked": 1, "completed": 1}
+    ).sort([("date", 1), ("doctor_id", 1)]).to_list(None)
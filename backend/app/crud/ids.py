@@ -0,0 +1,16 @@
+from typing import Iterable, List
+from bson import ObjectId
+from fastapi import HTTPException
+
+def is_object_id(value) -> bool:
+    return isinstance(value, ObjectId) or ObjectId.is_valid(value)
+
+def object_id(value, detail: str = "Niepoprawny format ID") -> ObjectId:
+    if isinstance(value, ObjectId):
+        return value
+    if not ObjectId.is_valid(value):
+        raise HTTPException(status_code=400, detail=detail)
+    return ObjectId(value)
+
+def object_ids(values: Iterable, detail: str = "Niepoprawny format ID") -> List[ObjectId]:
+    return [object_id(value, detail) for value in values]
@@ -0,0 +1,29 @@
+from typing import List, Optional
+from bson import ObjectId
+from ..database import medical_history_collection, medical_history_read_collection
+
+read_collection = medical_history_read_collection
+
+async def list_for_patient(patient_id: ObjectId, limit: int = 100) -> List[dict]:
+    return await medical_history_collection.find({"patient_id": patient_id}).sort("date", -1).to_list(limit)
+
+async def by_appointment(appointment_ids: List[ObjectId]) -> dict:
+    # Jedno zapytanie o historię dla wszystkich wizyt zamiast find_one w pętli
+    histories = {}
+    if appointment_ids:
+        async for history in medical_history_collection.find({"appointment_id": {"$in": appointment_ids}}):
+            histories.setdefault(history["appointment_id"], history)
+    return histories
+
+async def search(text: str, scope: dict, page_filter: Optional[dict], limit: int) -> List[dict]:
+    pipeline = [
+        {"$match": {"$text": {"$search": text}, **scope}},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+    if page_filter:
+        pipeline.append({"$match": page_filter})
+    pipeline += [
+        {"$sort": {"score": -1, "_id": -1}},
+        {"$limit": limit},
+    ]
+    return await medical_history_read_collection.aggregate(pipeline).to_list(limit)
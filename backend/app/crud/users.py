@@ -0,0 +1,51 @@
+from typing import Iterable, List, Optional
+from bson import ObjectId
+from ..database import user_collection, user_read_collection
+
+# Projekcje per przypadek użycia - hashed_password opuszcza bazę tylko przy logowaniu
+PUBLIC = {"email": 1, "full_name": 1, "role": 1, "is_active": 1}
+LOGIN = {**PUBLIC, "hashed_password": 1}
+CONTACT = {"full_name": 1, "email": 1}
+
+async def get(user_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+    return await user_collection.find_one({"_id": user_id}, projection)
+
+async def get_doctor(doctor_id: ObjectId, projection: Optional[dict] = PUBLIC) -> Optional[dict]:
+    return await user_collection.find_one({"_id": doctor_id, "role": "doctor"}, projection)
+
+async def find_for_login(email: str) -> Optional[dict]:
+    return await user_collection.find_one({"email": email}, LOGIN)
+
+async def email_taken(email: str) -> bool:
+    return await user_collection.find_one({"email": email}, {"_id": 1}) is not None
+
+async def create(user: dict) -> dict:
+    # Dokument zwracany lokalnie - bez ponownego odczytu po insert_one
+    result = await user_collection.insert_one(user)
+    user["_id"] = result.inserted_id
+    return user
+
+async def update(user_id: ObjectId, changes: dict) -> None:
+    await user_collection.update_one({"_id": user_id}, {"$set": changes})
+
+async def list_doctors(active_only: bool = True, projection: Optional[dict] = PUBLIC, limit: int = 100) -> List[dict]:
+    query = {"role": "doctor", "is_active": True} if active_only else {"role": "doctor"}
+    return await user_read_collection.find(query, projection).to_list(limit)
+
+async def find_doctors(doctor_ids: Iterable[ObjectId], projection: Optional[dict] = None, active_only: bool = False) -> List[dict]:
+    query = {"_id": {"$in": list(doctor_ids)}, "role": "doctor"}
+    if active_only:
+        query["is_active"] = True
+    return await user_collection.find(query, projection).to_list(None)
+
+async def active_doctor_ids(doctor_ids: Optional[List[ObjectId]] = None) -> List[ObjectId]:
+    query = {"role": "doctor", "is_active": True}
+    if doctor_ids:
+        query["_id"] = {"$in": doctor_ids}
+    return [doc["_id"] for doc in await user_read_collection.find(query, {"_id": 1}).to_list(None)]
+
+async def names(user_ids: Iterable[ObjectId]) -> dict:
+    return {
+        doc["_id"]: doc.get("full_name")
+        for doc in await user_read_collection.find({"_id": {"$in": list(user_ids)}}, {"full_name": 1}).to_list(None)
+    }
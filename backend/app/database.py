@@ -1,16 +1,249 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, monitoring
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
 from dotenv import load_dotenv
+import asyncio
 import os
+from .query_audit import query_recorder
+from .middleware.metrics import mongo_metrics_listener
 
 load_dotenv()
 
-client = AsyncIOMotorClient(os.getenv("MONGO_DETAILS"))
-database = client.medical_app
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "medical_app")
+# Preferencja odczytu dla tras tylko do odczytu (publiczne listy, eksporty). Domyślnie primary -
+# secondaryPreferred odciąża primary, ale odczyty mogą nie widzieć świeżo zapisanych zmian
+READ_ONLY_PREFERENCE = make_read_preference(
+    read_pref_mode_from_name(os.getenv("MONGO_READ_ONLY_PREFERENCE", "primary")), None
+)
 
-user_collection = database.get_collection("users")
-appointment_collection = database.get_collection("appointments")
-medical_history_collection = database.get_collection("medical_histories")
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.open = 0
+        self.checked_out = 0
+        self.created_total = 0
+        self.checkout_failures = 0
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+    def connection_ready(self, event): pass
+
+    def connection_created(self, event):
+        self.open += 1
+        self.created_total += 1
+
+    def connection_closed(self, event):
+        self.open -= 1
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "open": self.open,
+            "checked_out": self.checked_out,
+            "created_total": self.created_total,
+            "checkout_failures": self.checkout_failures,
+            "max_pool_size": int(os.getenv("MONGO_MAX_POOL_SIZE", 100)),
+            "min_pool_size": int(os.getenv("MONGO_MIN_POOL_SIZE", 10)),
+        }
+
+
+pool_stats = PoolStatsListener()
+_client = None
+
+
+def create_client() -> AsyncIOMotorClient:
+    event_listeners = [mongo_metrics_listener, pool_stats]
+    # QUERY_AUDIT=1 zapisuje wykonywane zapytania, aby sprawdzić ich plany przez explain()
+    if os.getenv("QUERY_AUDIT") == "1":
+        event_listeners.append(query_recorder)
+
+    return AsyncIOMotorClient(
+        os.getenv("MONGO_DETAILS"),
+        maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", 100)),
+        minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", 10)),
+        maxIdleTimeMS=int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000)),
+        waitQueueTimeoutMS=int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000)),
+        serverSelectionTimeoutMS=int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+        connectTimeoutMS=int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        socketTimeoutMS=int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 30000)),
+        # snappy wymaga pakietu python-snappy - można go dopisać przez MONGO_COMPRESSORS po instalacji
+        compressors=os.getenv("MONGO_COMPRESSORS", "zstd,zlib"),
+        event_listeners=event_listeners,
+    )
+
+
+def get_client() -> AsyncIOMotorClient:
+    # Klient tworzony leniwie - w każdym procesie (workerze) osobno, dopiero po fork()
+    global _client
+    if _client is None:
+        _client = create_client()
+    return _client
+
+
+def get_database():
+    return get_client().get_database(MONGO_DB_NAME)
+
+
+def close_client() -> None:
+    global _client
+    if _client is not None:
+        _client.close()
+    _client = None
+    pool_stats.reset()
+
+
+def reset_client_after_fork() -> None:
+    # Klient sprzed fork() nie może być używany ani zamykany w procesie potomnym
+    global _client
+    _client = None
+    pool_stats.reset()
+
+
+class CollectionProxy:
+    """Odwołanie do kolekcji rozwiązywane przy każdym użyciu względem bieżącego klienta."""
+
+    def __init__(self, name: str, read_preference=None):
+        self.name = name
+        self._read_preference = read_preference
+        self._client = None
+        self._collection = None
+
+    def resolve(self):
+        client = get_client()
+        if self._client is not client:
+            self._collection = client.get_database(MONGO_DB_NAME).get_collection(
+                self.name, read_preference=self._read_preference
+            )
+            self._client = client
+        return self._collection
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+
+user_collection = CollectionProxy("users")
+appointment_collection = CollectionProxy("appointments")
+medical_history_collection = CollectionProxy("medical_histories")
+availability_summary_collection = CollectionProxy("availability_summaries")
+analytics_daily_collection = CollectionProxy("analytics_daily")
+analytics_dirty_collection = CollectionProxy("analytics_dirty")
+analytics_purged_collection = CollectionProxy("analytics_purged")
+job_state_collection = CollectionProxy("job_state")
+appointment_archive_collection = CollectionProxy("appointments_archive")
+appointment_bucket_collection = CollectionProxy("appointment_buckets")
+
+user_read_collection = CollectionProxy("users", READ_ONLY_PREFERENCE)
+appointment_read_collection = CollectionProxy("appointments", READ_ONLY_PREFERENCE)
+medical_history_read_collection = CollectionProxy("medical_histories", READ_ONLY_PREFERENCE)
+availability_summary_read_collection = CollectionProxy("availability_summaries", READ_ONLY_PREFERENCE)
+analytics_daily_read_collection = CollectionProxy("analytics_daily", READ_ONLY_PREFERENCE)
+appointment_archive_read_collection = CollectionProxy("appointments_archive", READ_ONLY_PREFERENCE)
+appointment_bucket_read_collection = CollectionProxy("appointment_buckets", READ_ONLY_PREFERENCE)
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("role", ASCENDING), ("is_active", ASCENDING)]),
+        IndexModel([("role", ASCENDING), ("is_active", ASCENDING), ("search_name", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("role", ASCENDING), ("is_active", ASCENDING), ("search_terms", ASCENDING)]),
+    ],
+    "appointments": [
+        IndexModel([("doctor_id", ASCENDING), ("start_time", ASCENDING)]),
+        IndexModel([("patient_id", ASCENDING), ("start_time", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("start_time", ASCENDING)]),
+        IndexModel(
+            [("start_time", ASCENDING), ("_id", ASCENDING)],
+            name="available_by_start_time",
+            partialFilterExpression={"status": "available"}
+        ),
+        IndexModel(
+            [("doctor_id", ASCENDING), ("start_time", ASCENDING), ("_id", ASCENDING)],
+            name="available_by_doctor_start_time",
+            partialFilterExpression={"status": "available"}
+        ),
+        IndexModel([("updated_at", ASCENDING)]),
+        IndexModel([("end_time", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    "appointments_archive": [
+        IndexModel([("patient_id", ASCENDING), ("start_time", DESCENDING)]),
+        IndexModel([("doctor_id", ASCENDING), ("start_time", ASCENDING)]),
+    ],
+    "appointment_buckets": [
+        IndexModel([("doctor_id", ASCENDING), ("date", ASCENDING)], unique=True),
+        IndexModel([("date", ASCENDING)]),
+        IndexModel([("slots._id", ASCENDING)]),
+        IndexModel([("slots.patient_id", ASCENDING)]),
+        IndexModel([("updated_at", ASCENDING)]),
+    ],
+    "medical_histories": [
+        IndexModel([("patient_id", ASCENDING), ("date", DESCENDING)]),
+        IndexModel([("appointment_id", ASCENDING)]),
+        IndexModel([("doctor_id", ASCENDING), ("date", DESCENDING)]),
+        IndexModel(
+            [("diagnosis", TEXT), ("treatment_notes", TEXT), ("recommendations", TEXT)],
+            name="history_text",
+            weights={"diagnosis": 10, "recommendations": 3, "treatment_notes": 1},
+            # Brak stemmingu dla języka polskiego - wyszukiwanie po pełnych słowach
+            default_language="none"
+        ),
+    ],
+    "availability_summaries": [
+        IndexModel([("doctor_id", ASCENDING), ("date", ASCENDING)], unique=True),
+        IndexModel([("date", ASCENDING)]),
+    ],
+    "analytics_daily": [
+        IndexModel([("doctor_id", ASCENDING), ("date", ASCENDING)], unique=True),
+        IndexModel([("date", ASCENDING)]),
+    ],
+    "analytics_dirty": [
+        IndexModel([("doctor_id", ASCENDING), ("date", ASCENDING)], unique=True),
+    ],
+    "analytics_purged": [
+        IndexModel([("doctor_id", ASCENDING), ("start_time", ASCENDING)], unique=True),
+    ],
+}
+
+# Kod błędu serwera (IllegalOperation) dla transakcji na samodzielnym mongod
+TRANSACTIONS_UNSUPPORTED = 20
+
+async def supports_transactions() -> bool:
+    # Transakcje (zakończenie wizyty z wpisem historii) wymagają replica setu albo mongos
+    hello = await get_client().admin.command("hello")
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
 
 async def init_db():
-    await user_collection.create_index("email", unique=True)
-    await appointment_collection.create_index([("doctor_id", 1), ("start_time", 1)])
\ No newline at end of file
+    for collection_name, indexes in INDEXES.items():
+        await get_database().get_collection(collection_name).create_indexes(indexes)
+    if os.getenv("SLOT_STORAGE", "documents") == "buckets":
+        # Strumień /appointment/live porównuje stan kubełka przed i po zmianie (MongoDB 6.0+)
+        await get_database().command("collMod", "appointment_buckets", changeStreamPreAndPostImages={"enabled": True})
+
+async def verify_indexes() -> dict:
+    missing = {}
+    for collection_name, indexes in INDEXES.items():
+        existing = await get_database().get_collection(collection_name).index_information()
+        names = [index.document["name"] for index in indexes if index.document["name"] not in existing]
+        if names:
+            missing[collection_name] = names
+    return missing
+
+
+async def warm_up_pool(connections: int | None = None) -> None:
+    # Otwiera połączenia z puli zanim aplikacja zgłosi gotowość
+    connections = connections or int(os.getenv("MONGO_WARMUP_CONNECTIONS", os.getenv("MONGO_MIN_POOL_SIZE", 10)))
+    admin = get_client().admin
+    await asyncio.gather(*(admin.command("ping") for _ in range(max(1, connections))))
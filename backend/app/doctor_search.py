@@ -0,0 +1,47 @@
+import re
+from datetime import datetime
+from typing import Optional
+from .crud import appointments as appointment_crud
+from .database import user_read_collection
+from .pagination import encode_cursor, keyset_filter
+
+DOCTOR_FIELDS = {"email": 1, "full_name": 1, "role": 1, "is_active": 1, "search_name": 1}
+
+def search_fields(full_name: str, email: str) -> dict:
+    # Znormalizowane pola pod indeks: pełna nazwa, każde słowo i email (małymi literami)
+    name = " ".join(full_name.lower().split())
+    terms = {name, email.lower(), *name.split()}
+    return {"search_name": name, "search_terms": sorted(terms)}
+
+async def search_doctors(
+    q: Optional[str],
+    cursor: Optional[str],
+    size: int,
+    with_free_slots: bool,
+    include_inactive: bool = False,
+) -> dict:
+    # Ograniczenie is_active (także dla admina) pozwala indeksowi dostarczyć sortowanie
+    query = {"role": "doctor", "is_active": {"$in": [True, False]} if include_inactive else True}
+    if q:
+        query["search_terms"] = {"$regex": "^" + re.escape(" ".join(q.lower().split()))}
+    query.update(keyset_filter("search_name", cursor))
+
+    doctors = await user_read_collection.find(query, DOCTOR_FIELDS) \
+        .sort([("search_name", 1), ("_id", 1)]) \
+        .limit(size + 1) \
+        .to_list(size + 1)
+
+    next_cursor = None
+    if len(doctors) > size:
+        doctors = doctors[:size]
+        next_cursor = encode_cursor(doctors[-1].get("search_name", ""), doctors[-1]["_id"])
+
+    if with_free_slots and doctors:
+        counts = await appointment_crud.count_free_by_doctor([doc["_id"] for doc in doctors], datetime.utcnow())
+        for doc in doctors:
+            doc["free_slots"] = counts.get(doc["_id"], 0)
+
+    for doc in doctors:
+        doc.pop("search_name", None)
+
+    return {"items": doctors, "size": size, "next_cursor": next_cursor}
@@ -0,0 +1,67 @@
+import csv
+import io
+import os
+from datetime import date, datetime
+from typing import AsyncIterator, List
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from .serialization import dumps
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, list):
+        return "; ".join(_csv_value(item) for item in value)
+    if isinstance(value, dict):
+        return dumps(value).decode("utf-8")
+    return value
+
+async def _ndjson_rows(cursor) -> AsyncIterator[bytes]:
+    chunk = []
+    async for doc in cursor:
+        chunk.append(dumps(doc))
+        if len(chunk) >= EXPORT_BATCH_SIZE:
+            yield b"\n".join(chunk) + b"\n"
+            chunk = []
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+async def _csv_rows(cursor, fields: List[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    rows = 0
+    async for doc in cursor:
+        writer.writerow([_csv_value(doc.get(field)) for field in fields])
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+def stream_cursor(cursor, fields: List[str], fmt: str, filename: str) -> StreamingResponse:
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Nieobsługiwany format eksportu: {fmt}")
+
+    body = _ndjson_rows(cursor) if fmt == "ndjson" else _csv_rows(cursor, fields)
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
+
+def stream_export(collection, query: dict, fields: List[str], sort: list, fmt: str, filename: str) -> StreamingResponse:
+    projection = {field: 1 for field in fields}
+    if "_id" not in fields:
+        projection["_id"] = 0
+    cursor = collection.find(query, projection).sort(sort).batch_size(EXPORT_BATCH_SIZE)
+    return stream_cursor(cursor, fields, fmt, filename)
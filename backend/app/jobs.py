@@ -0,0 +1,40 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from .database import job_state_collection
+
+logger = logging.getLogger(__name__)
+
+# Stan zadań w tle: {_id: nazwa zadania, lease_until, ...pola zadania}
+
+async def acquire_lease(job_id: str, seconds: float) -> Optional[dict]:
+    # Przy kilku workerach zadanie wykonuje tylko ten, który przejmie dzierżawę
+    now = datetime.utcnow()
+    try:
+        return await job_state_collection.find_one_and_update(
+            {"_id": job_id, "$or": [{"lease_until": {"$lt": now}}, {"lease_until": None}]},
+            {"$set": {"lease_until": now + timedelta(seconds=seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return None
+
+async def save_state(job_id: str, **fields) -> None:
+    await job_state_collection.update_one({"_id": job_id}, {"$set": fields})
+
+async def release_lease(job_id: str, **fields) -> None:
+    await save_state(job_id, lease_until=None, **fields)
+
+async def run_periodically(job: Callable[[], Awaitable], interval: float) -> None:
+    while True:
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except PyMongoError as exc:
+            logger.warning("Zadanie %s nie powiodło się (%s)", getattr(job, "__name__", job), exc)
+        await asyncio.sleep(interval)
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+from . import slot_buckets
+from .database import appointment_bucket_collection, appointment_collection
+from .serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", 256))
+REPLAY_BUFFER_SIZE = int(os.getenv("LIVE_REPLAY_SIZE", 1024))
+RESYNC = object()
+
+_WATCHED_OPERATIONS = ["insert", "update", "replace", "delete"]
+_PROJECTED_FIELDS = ("_id", "doctor_id", "patient_id", "start_time", "end_time", "status")
+
+
+class Subscription:
+    def __init__(self, doctor_id: Optional[ObjectId], date_from: Optional[datetime], date_to: Optional[datetime]):
+        self.doctor_id = doctor_id
+        self.date_from = date_from
+        self.date_to = date_to
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def wants(self, event: dict) -> bool:
+        appointment = event.get("appointment")
+        if appointment is None:
+            # Usunięcia nie mają pełnego dokumentu - wysyłamy wszystkim
+            return True
+        if self.doctor_id is not None and appointment.get("doctor_id") != self.doctor_id:
+            return False
+        start = appointment.get("start_time")
+        if self.date_from is not None and (start is None or start < self.date_from):
+            return False
+        if self.date_to is not None and (start is None or start >= self.date_to):
+            return False
+        return True
+
+    def offer(self, item) -> bool:
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def force_resync(self) -> None:
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESYNC)
+
+
+class ScheduleBroadcaster:
+    """Jeden change stream na kolekcji appointments (lub appointment_buckets) rozsyłany do wszystkich subskrybentów SSE."""
+
+    def __init__(self):
+        self._subscribers: set = set()
+        self._replay: deque = deque(maxlen=REPLAY_BUFFER_SIZE)
+        self._resume_token = None
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, subscription: Subscription, last_event_id: Optional[str] = None) -> None:
+        if last_event_id:
+            self._replay_since(subscription, last_event_id)
+        self._subscribers.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def _replay_since(self, subscription: Subscription, last_event_id: str) -> None:
+        ids = [event_id for event_id, _ in self._replay]
+        if last_event_id not in ids:
+            subscription.offer(RESYNC)
+            return
+        for event_id, event in list(self._replay)[ids.index(last_event_id) + 1:]:
+            if subscription.wants(event) and not subscription.offer((event_id, event)):
+                subscription.force_resync()
+                return
+
+    def _publish(self, event_id: str, event: dict) -> None:
+        self._replay.append((event_id, event))
+        for subscription in list(self._subscribers):
+            if subscription.wants(event) and not subscription.offer((event_id, event)):
+                # Wolny klient - odłączamy go, po ponownym połączeniu dostanie "resync"
+                self._subscribers.discard(subscription)
+                subscription.force_resync()
+
+    def _resync_all(self) -> None:
+        self._replay.clear()
+        for subscription in list(self._subscribers):
+            self._subscribers.discard(subscription)
+            subscription.force_resync()
+
+    @staticmethod
+    def _to_event(change: dict) -> dict:
+        document = change.get("fullDocument")
+        return {
+            "operation": change["operationType"],
+            "appointment_id": change["documentKey"]["_id"],
+            "appointment": {k: document.get(k) for k in _PROJECTED_FIELDS} if document else None,
+        }
+
+    @staticmethod
+    def _bucket_events(change: dict) -> list:
+        # Zmiana kubełka dotyczy wielu slotów - porównujemy stan przed i po (pre-images kolekcji)
+        previous = change.get("fullDocumentBeforeChange") or {}
+        document = change.get("fullDocument") or {}
+        doctor_id = document.get("doctor_id", previous.get("doctor_id"))
+        before = {slot["_id"]: slot for slot in previous.get("slots", [])}
+        after = {slot["_id"]: slot for slot in document.get("slots", [])}
+
+        events = []
+        for slot_id, slot in after.items():
+            old = before.get(slot_id)
+            if old is not None and all(old.get(k) == slot.get(k) for k in _PROJECTED_FIELDS):
+                continue
+            appointment = {k: slot.get(k) for k in _PROJECTED_FIELDS}
+            appointment["doctor_id"] = doctor_id
+            events.append({"operation": "insert" if old is None else "update", "appointment_id": slot_id, "appointment": appointment})
+        for slot_id in before.keys() - after.keys():
+            events.append({"operation": "delete", "appointment_id": slot_id, "appointment": None})
+        return events
+
+    def _publish_change(self, change: dict) -> None:
+        if not slot_buckets.BUCKETED:
+            self._publish(change["_id"]["_data"], self._to_event(change))
+            return
+        for i, event in enumerate(self._bucket_events(change)):
+            self._publish(f"{change['_id']['_data']}.{i}", event)
+
+    async def _run(self) -> None:
+        backoff = 1
+        while True:
+            try:
+                options = {"full_document": "updateLookup", "resume_after": self._resume_token}
+                collection = appointment_collection
+                if slot_buckets.BUCKETED:
+                    collection = appointment_bucket_collection
+                    options["full_document_before_change"] = "whenAvailable"
+                async with collection.watch(
+                    [{"$match": {"operationType": {"$in": _WATCHED_OPERATIONS}}}], **options
+                ) as stream:
+                    backoff = 1
+                    async for change in stream:
+                        self._resume_token = change["_id"]
+                        self._publish_change(change)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as exc:
+                # Np. token spoza oplogu - zaczynamy od bieżącego momentu, klienci muszą się zsynchronizować
+                logger.warning("Change stream nie może zostać wznowiony (%s)", exc)
+                if self._resume_token is not None:
+                    self._resume_token = None
+                    self._resync_all()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            except PyMongoError as exc:
+                logger.warning("Change stream przerwany (%s), ponowienie za %ss", exc, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+
+broadcaster = ScheduleBroadcaster()
+
+
+def reset_broadcaster() -> None:
+    # Zadanie change streamu rodzica nie istnieje w procesie potomnym
+    broadcaster.__init__()
+
+
+def format_event(item) -> bytes:
+    if item is RESYNC:
+        return b"event: resync\ndata: {}\n\n"
+    event_id, event = item
+    return b"id: " + event_id.encode("utf-8") + b"\nevent: appointment\ndata: " + dumps(event) + b"\n\n"
@@ -1,9 +1,50 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
-from .database import init_db
-from .routes import auth, appointments, doctors, users, admin
+from .database import close_client, init_db, supports_transactions, warm_up_pool
+from .auth.security import shutdown_hashing_executor
+from .middleware.metrics import CONTENT_TYPE, MetricsMiddleware, metrics
+from .live import broadcaster
+from .analytics import REFRESH_SECONDS, refresh_rollups
+from .archival import ARCHIVE_INTERVAL_SECONDS, archive_appointments
+from .jobs import run_periodically
+from .migrations import run_pending as run_pending_migrations
+from . import workers  # noqa: F401 - rejestruje reset singletonów po fork()
+from .routes import auth, appointments, doctors, users, admin, health
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    print("Inicjalizacja połączenia z MongoDB ...")
+    await init_db()
+    for name, result in (await run_pending_migrations()).items():
+        print(f"Migracja {name}: {result}")
+    await warm_up_pool()
+    app.state.transactions = await supports_transactions()
+    if not app.state.transactions:
+        print("UWAGA: MongoDB nie działa jako replica set - /doctor/add-history zwróci 503, a /health/ready błąd")
+    # Interwał 0 wyłącza dane zadanie w procesie API (np. gdy uruchamia je cron)
+    background_tasks = [
+        asyncio.create_task(run_periodically(job, interval))
+        for job, interval in ((refresh_rollups, REFRESH_SECONDS), (archive_appointments, ARCHIVE_INTERVAL_SECONDS))
+        if interval > 0
+    ]
+    app.state.ready = True
+    print("Baza danych gotowa")
+
+    yield
+
+    app.state.ready = False
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    shutdown_hashing_executor()
+    await broadcaster.stop()
+    close_client()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,11 +54,7 @@ app.add_middleware(
     allow_headers=['*'],
 )
 
-@app.on_event("startup")
-async def startup_enevt():
-    print("Inicjalizacja połączenia z MongoDB ...")
-    await init_db()
-    print("Baza danych gotowa")
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(
     auth.router,
@@ -49,6 +86,16 @@ app.include_router(
     tags=["Admin"]
 )
 
+app.include_router(
+    health.router,
+    prefix="/health",
+    tags=["Health"]
+)
+
 @app.get("/")
 def read_root():
-    return {"message": "System reerwacji wizyt - API działa!"}
\ No newline at end of file
+    return {"message": "System reerwacji wizyt - API działa!"}
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
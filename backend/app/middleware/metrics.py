@@ -0,0 +1,169 @@
+import os
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from threading import Lock
+from typing import Optional
+import bson
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+# Rozmiar odpowiedzi wymaga ponownego zakodowania jej do BSON - tylko na żądanie (diagnostyka)
+REPLY_BYTES = os.getenv("MONGO_METRICS_REPLY_BYTES") == "1"
+# Przy kilku workerach (gunicorn) każdy zapisuje liczniki do plików w tym katalogu,
+# a /metrics sumuje je ze wszystkich procesów - ustawiane w gunicorn.conf.py
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+class RequestStats:
+    __slots__ = ("scope", "mongo_commands")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.mongo_commands = 0
+
+    @property
+    def route(self) -> str:
+        # Szablon ścieżki (np. /user/book/{appointment_id}) jest znany dopiero po dopasowaniu routingu
+        route = self.scope.get("route")
+        return route.path if route is not None else "unmatched"
+
+
+# Obiekt mutowalny - Motor wykonuje komendy w wątkach z kopią kontekstu
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        # Nowy rejestr po fork() - w trybie wieloprocesowym liczniki trafiają do plików z PID workera
+        self._lock = Lock()
+        self.registry = CollectorRegistry()
+        self.in_flight = Gauge("http_requests_in_flight", "Requests currently being processed",
+                               registry=self.registry, multiprocess_mode="livesum")
+        self.requests = Counter("http_requests_total", "Handled HTTP requests", ("method", "route", "status"),
+                                registry=self.registry)
+        self.latency = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"),
+                                 buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.command_counts = Histogram("http_request_mongo_commands", "MongoDB commands issued per request",
+                                        ("method", "route"), buckets=COMMAND_COUNT_BUCKETS, registry=self.registry)
+        self.mongo_commands = Counter("mongo_commands_total", "MongoDB commands", ("route", "command"),
+                                      registry=self.registry)
+        self.mongo_duration = Counter("mongo_command_duration_seconds_total", "Time spent in MongoDB commands",
+                                      ("route", "command"), registry=self.registry)
+        self.mongo_bytes = None
+        if REPLY_BYTES:
+            self.mongo_bytes = Counter("mongo_reply_bytes_total", "Bytes returned by MongoDB", ("route", "command"),
+                                       registry=self.registry)
+        self.counters = {}
+
+    def request_started(self) -> None:
+        self.in_flight.inc()
+
+    def request_finished(self, method: str, stats: RequestStats, status_code: int, duration: float) -> None:
+        self.in_flight.dec()
+        self.requests.labels(method, stats.route, str(status_code)).inc()
+        self.latency.labels(method, stats.route).observe(duration)
+        self.command_counts.labels(method, stats.route).observe(stats.mongo_commands)
+
+    def mongo_command(self, route: str, command: str, duration: float, reply_bytes: int) -> None:
+        self.mongo_commands.labels(route, command).inc()
+        self.mongo_duration.labels(route, command).inc(duration)
+        if self.mongo_bytes is not None:
+            self.mongo_bytes.labels(route, command).inc(reply_bytes)
+
+    def increment(self, name: str, **labels) -> None:
+        counter = self.counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self.counters.get(name)
+                if counter is None:
+                    counter = Counter(name, name, sorted(labels), registry=self.registry)
+                    self.counters[name] = counter
+        counter.labels(**labels).inc()
+
+    def commands_per_request(self) -> dict:
+        """Suma i liczba obserwacji histogramu komend na trasę (method, route) - tylko bieżący proces."""
+        totals = defaultdict(lambda: [0.0, 0])
+        for metric in self.command_counts.collect():
+            for sample in metric.samples:
+                key = (sample.labels["method"], sample.labels["route"])
+                if sample.name.endswith("_sum"):
+                    totals[key][0] += sample.value
+                elif sample.name.endswith("_count"):
+                    totals[key][1] += int(sample.value)
+        return {key: tuple(value) for key, value in totals.items()}
+
+    def render(self) -> bytes:
+        if not MULTIPROCESS:
+            return generate_latest(self.registry)
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+
+
+metrics = MetricsRegistry()
+
+
+class MongoMetricsListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        stats = current_request.get()
+        if stats is not None:
+            stats.mongo_commands += 1
+        metrics.mongo_command(
+            stats.route if stats is not None else "background",
+            event.command_name,
+            event.duration_micros / 1_000_000,
+            len(bson.encode(event.reply)) if REPLY_BYTES and event.reply else 0,
+        )
+
+    def failed(self, event):
+        stats = current_request.get()
+        if stats is not None:
+            stats.mongo_commands += 1
+        metrics.mongo_command(
+            stats.route if stats is not None else "background",
+            event.command_name,
+            event.duration_micros / 1_000_000,
+            0,
+        )
+
+
+mongo_metrics_listener = MongoMetricsListener()
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+        metrics.request_started()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.request_finished(scope["method"], stats, status_code, time.perf_counter() - started)
+            current_request.reset(token)
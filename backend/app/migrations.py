@@ -0,0 +1,73 @@
+import asyncio
+import os
+from .database import appointment_archive_collection, appointment_collection, medical_history_collection, user_collection
+from .availability import rebuild_summaries
+from .doctor_search import search_fields
+from .jobs import acquire_lease, release_lease, save_state
+
+MIGRATIONS_JOB = "migrations"
+MIGRATION_LEASE_SECONDS = float(os.getenv("MIGRATION_LEASE_SECONDS", 600))
+
+# Pola z referencjami, które historycznie bywały zapisywane jako string
+FOREIGN_KEYS = [
+    (medical_history_collection, ["patient_id", "appointment_id", "doctor_id"]),
+    (appointment_collection, ["patient_id", "doctor_id"]),
+    (appointment_archive_collection, ["patient_id", "doctor_id"]),
+]
+
+async def normalize_foreign_keys() -> dict:
+    report = {}
+    for collection, fields in FOREIGN_KEYS:
+        for field in fields:
+            result = await collection.update_many(
+                {field: {"$type": "string"}},
+                [{"$set": {field: {"$convert": {
+                    "input": f"${field}", "to": "objectId", "onError": f"${field}"
+                }}}}]
+            )
+            report[f"{collection.name}.{field}"] = result.modified_count
+    return report
+
+async def backfill_doctor_search_fields() -> int:
+    updated = 0
+    async for doctor in user_collection.find({"role": "doctor"}, {"full_name": 1, "email": 1}):
+        await user_collection.update_one(
+            {"_id": doctor["_id"]},
+            {"$set": search_fields(doctor.get("full_name", ""), doctor.get("email", ""))}
+        )
+        updated += 1
+    return updated
+
+# Migracje danych wykonywane raz na bazę przy starcie aplikacji - w kolejności, każda idempotentna
+MIGRATIONS = [
+    ("normalize_foreign_keys", normalize_foreign_keys),
+    # Liczniki aktualizowane przez $inc zakładają, że podsumowania obejmują wszystkie istniejące sloty
+    ("rebuild_availability_summaries", rebuild_summaries),
+    # Wyszukiwanie i kursor sortują po search_name - lekarz bez tego pola byłby niewidoczny
+    ("backfill_doctor_search_fields", backfill_doctor_search_fields),
+]
+
+async def run_pending() -> dict:
+    """Wykonuje niezastosowane migracje; pozostałe workery czekają, aż dzierżawca skończy."""
+    while (state := await acquire_lease(MIGRATIONS_JOB, MIGRATION_LEASE_SECONDS)) is None:
+        await asyncio.sleep(1)
+    applied = list(state.get("applied", []))
+    executed = {}
+    try:
+        for name, migration in MIGRATIONS:
+            if name in applied:
+                continue
+            executed[name] = await migration()
+            applied.append(name)
+            await save_state(MIGRATIONS_JOB, applied=applied)
+    finally:
+        await release_lease(MIGRATIONS_JOB)
+    return executed
+
+async def run_all() -> dict:
+    # Ręczne, wymuszone wykonanie wszystkich migracji (np. po imporcie danych z zewnątrz)
+    return {name: await migration() for name, migration in MIGRATIONS}
+
+if __name__ == "__main__":
+    for name, result in asyncio.run(run_all()).items():
+        print(f"{name}: {result}")
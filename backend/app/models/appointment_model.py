@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from .helper import PyObjectId
-from datetime import datetime
-from typing import Optional, List
+from datetime import date, datetime, time
+from typing import Literal, Optional, List
 
 class AppointmentModel(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
@@ -16,6 +16,13 @@ class AppointmentUpdate(BaseModel):
     end_time: Optional[datetime] = None
     status: Optional[str] = None
 
+class AppointmentBatchItem(AppointmentUpdate):
+    appointment_id: str
+    action: Literal["update", "delete"] = "update"
+
+class AppointmentBatch(BaseModel):
+    items: List[AppointmentBatchItem] = Field(..., min_length=1, max_length=1000)
+
 class BreakTime(BaseModel):
     start: datetime
     end: datetime
@@ -26,3 +33,17 @@ class BulkScheduleCreate(BaseModel):
     end_time: datetime
     interval_minutes: int = Field(15, ge=5, le=120)
     breaks: List[BreakTime] = Field(default_factory=list)
+
+class DailyBreak(BaseModel):
+    start: time
+    end: time
+
+class BatchScheduleCreate(BaseModel):
+    doctor_ids: List[str] = Field(..., min_length=1)
+    date_from: date
+    date_to: date
+    weekdays: List[int] = Field(default_factory=lambda: [0, 1, 2, 3, 4])  # 0 = poniedziałek
+    day_start: time
+    day_end: time
+    interval_minutes: int = Field(15, ge=5, le=120)
+    breaks: List[DailyBreak] = Field(default_factory=list)
@@ -0,0 +1,35 @@
+import base64
+from datetime import datetime
+from bson import ObjectId
+from fastapi import HTTPException
+
+def encode_cursor(sort_value, doc_id: ObjectId) -> str:
+    if isinstance(sort_value, datetime):
+        raw = f"d|{sort_value.isoformat()}|{doc_id}"
+    else:
+        raw = f"{type(sort_value).__name__[0]}|{sort_value}|{doc_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        kind, value, doc_id = base64.urlsafe_b64decode(padded).decode("utf-8").rsplit("|", 2)
+        if kind == "d":
+            value = datetime.fromisoformat(value)
+        elif kind == "f":
+            value = float(value)
+        elif kind == "i":
+            value = int(value)
+        return value, ObjectId(doc_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Niepoprawny kursor paginacji")
+
+def keyset_filter(field: str, cursor: str | None, direction: int = 1) -> dict:
+    if not cursor:
+        return {}
+    value, doc_id = decode_cursor(cursor)
+    op = "$gt" if direction == 1 else "$lt"
+    return {"$or": [
+        {field: {op: value}},
+        {field: value, "_id": {op: doc_id}},
+    ]}
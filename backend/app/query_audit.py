@@ -0,0 +1,64 @@
+from pymongo import monitoring
+
+# Komendy, których plan zapytania da się sprawdzić przez explain
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+_STRIPPED_FIELDS = {
+    "lsid", "txnNumber", "$db", "$clusterTime", "$readPreference", "writeConcern",
+    "readConcern", "apiVersion", "apiStrict", "startTransaction", "autocommit",
+}
+
+class QueryRecorder(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name in EXPLAINABLE_COMMANDS:
+            command = {k: v for k, v in event.command.items() if k not in _STRIPPED_FIELDS}
+            self.commands.append((event.database_name, command))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def clear(self):
+        self.commands.clear()
+
+query_recorder = QueryRecorder()
+
+def _winning_plans(node):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "winningPlan":
+                yield value
+            else:
+                yield from _winning_plans(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _winning_plans(item)
+
+def _has_collscan(node) -> bool:
+    if isinstance(node, dict):
+        if node.get("stage") == "COLLSCAN":
+            return True
+        return any(_has_collscan(value) for value in node.values())
+    if isinstance(node, list):
+        return any(_has_collscan(item) for item in node)
+    return False
+
+async def find_collection_scans(client, commands=None) -> list:
+    offenders = []
+    seen = set()
+    for database_name, command in commands if commands is not None else query_recorder.commands:
+        key = repr(command)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        explain = await client[database_name].command(
+            {"explain": command, "verbosity": "queryPlanner"}
+        )
+        if any(_has_collscan(plan) for plan in _winning_plans(explain)):
+            offenders.append(command)
+    return offenders
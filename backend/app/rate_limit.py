@@ -0,0 +1,100 @@
+import math
+from abc import ABC, abstractmethod
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Hashable, Tuple
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+from .middleware.metrics import metrics
+
+# Limity w formacie (pojemność kubełka, uzupełnianie na minutę) - pojemność 0 wyłącza limit.
+# LocalRateLimitStore liczy osobno w każdym workerze - efektywny limit to wartość x WEB_CONCURRENCY.
+LOGIN_IP_LIMIT = (int(os.getenv("LOGIN_IP_BURST", 20)), float(os.getenv("LOGIN_IP_PER_MINUTE", 10)))
+LOGIN_ACCOUNT_LIMIT = (int(os.getenv("LOGIN_ACCOUNT_BURST", 5)), float(os.getenv("LOGIN_ACCOUNT_PER_MINUTE", 2)))
+REGISTER_IP_LIMIT = (int(os.getenv("REGISTER_IP_BURST", 5)), float(os.getenv("REGISTER_IP_PER_MINUTE", 2)))
+
+
+class RateLimitStore(ABC):
+    """Magazyn kubełków - implementacja współdzielona (np. Redis) musi wykonać take() atomowo."""
+
+    @abstractmethod
+    async def take(self, key: Hashable, capacity: int, per_second: float) -> float:
+        """Pobiera token; zwraca 0, gdy się udało, w przeciwnym razie liczbę sekund do następnego tokenu."""
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Czyści stan procesu - wywoływane po fork()."""
+
+
+class LocalRateLimitStore(RateLimitStore):
+    """Kubełki w pamięci procesu - każdy worker liczy osobno. Zegar można podmienić w testach."""
+
+    def __init__(self, maxsize: int = 100000, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.reset()
+
+    def reset(self) -> None:
+        # Po fork() blokada mogła zostać skopiowana w stanie zajętym
+        self._lock = Lock()
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: Hashable, capacity: int, per_second: float) -> float:
+        now = self.clock()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (float(capacity), now))
+            tokens = min(float(capacity), tokens + (now - updated_at) * per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # Wypierany jest najdawniej używany kubełek - przy takim ruchu i tak byłby już pełny
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        if allowed:
+            return 0.0
+        return (1 - tokens) / per_second if per_second > 0 else math.inf
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+_store: RateLimitStore = LocalRateLimitStore(maxsize=int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000)))
+
+def set_store(store: RateLimitStore) -> None:
+    global _store
+    _store = store
+
+def reset_rate_limits() -> None:
+    _store.reset()
+
+def client_ip(request: Request) -> str:
+    # Za proxy adres klienta ustawia uvicorn/gunicorn (--proxy-headers, forwarded_allow_ips)
+    return request.client.host if request.client else "unknown"
+
+async def check(endpoint: str, scope: str, value: str, limit: Tuple[int, float]) -> None:
+    capacity, per_minute = limit
+    if capacity <= 0:
+        return
+    retry_after = await _store.take((endpoint, scope, value), capacity, per_minute / 60)
+    if retry_after:
+        metrics.increment("rate_limit_rejected_total", endpoint=endpoint, scope=scope)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Zbyt wiele prób, spróbuj ponownie za chwilę",
+            headers={"Retry-After": str(math.ceil(min(retry_after, 3600)))},
+        )
+
+async def limit_login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()) -> None:
+    # Formularz jest cache'owany przez FastAPI - endpoint dostaje ten sam obiekt bez ponownego parsowania
+    ip = client_ip(request)
+    await check("login", "ip", ip, LOGIN_IP_LIMIT)
+    # Kubełek konta liczony osobno dla każdego adresu - inaczej ktokolwiek znający login
+    # mógłby odcinać prawdziwego użytkownika samymi nieudanymi próbami
+    await check("login", "account", f"{form_data.username.strip().lower()}|{ip}", LOGIN_ACCOUNT_LIMIT)
+
+async def limit_register(request: Request) -> None:
+    await check("register", "ip", client_ip(request), REGISTER_IP_LIMIT)
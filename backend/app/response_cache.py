@@ -0,0 +1,51 @@
+import hashlib
+import os
+from typing import Awaitable, Callable
+from fastapi import Request, Response
+from .cache import TTLCache
+
+# Wersje przestrzeni nazw zmieniane przy zapisach - unieważniają wpisy w cache tego procesu.
+# Inne workery widzą zmianę dopiero po wygaśnięciu wpisu (RESPONSE_CACHE_TTL_SECONDS),
+# ale ETag liczony z treści sprawia, że 304 nigdy nie potwierdza nieaktualnej odpowiedzi.
+_versions = {}
+_responses = TTLCache(
+    maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 30)),
+)
+
+def reset() -> None:
+    _versions.clear()
+    _responses.reset()
+
+def invalidate(namespace: str) -> None:
+    _versions[namespace] = _versions.get(namespace, 0) + 1
+
+def make_etag(namespace: str, body: bytes) -> str:
+    # Ta sama treść daje ten sam ETag w każdym workerze
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    return f'W/"{namespace}-{digest}"'
+
+def _matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return any(candidate.strip() in (etag, "*") for candidate in if_none_match.split(","))
+
+async def cached_response(
+    request: Request,
+    namespace: str,
+    producer: Callable[[], Awaitable[bytes]],
+) -> Response:
+    key = (namespace, _versions.get(namespace, 0), request.url.path, request.url.query)
+
+    entry = _responses.get(key)
+    if entry is None:
+        body = await producer()
+        entry = (body, make_etag(namespace, body))
+        _responses.set(key, entry)
+
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
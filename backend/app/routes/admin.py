@@ -1,116 +1,178 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from bson import ObjectId
-from typing import List
-from datetime import datetime, timedelta
-from ..models.user_model import UserModel
-from ..database import appointment_collection, user_collection
-from ..auth.deps import get_current_user
-from ..models.appointment_model import BulkScheduleCreate, AppointmentUpdate
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+import os
+from ..crud import analytics_daily as analytics_crud, appointments as appointment_crud, users as user_crud
+from ..crud.ids import is_object_id, object_id, object_ids
+from ..auth.deps import get_current_principal, invalidate_principal
+from ..serialization import MongoJSONResponse
+from ..models.appointment_model import BulkScheduleCreate, BatchScheduleCreate, AppointmentUpdate, AppointmentBatch
 from ..schemas.user_dto import UserCreate, UserOut, DoctorUpdate
-from ..auth.security import hash_password
+from ..auth.security import hash_password_async
 from ..models.auth_model import AdminPasswordReset
+from ..availability import record_new_slots, record_move, record_transition, record_changes
+from ..export import EXPORT_BATCH_SIZE, stream_cursor
+from ..analytics import mark_dirty, refresh_rollups
+from ..archival import archive_appointments
+from ..response_cache import invalidate
+from ..doctor_search import search_doctors, search_fields
+from ..scheduling import find_overlaps, generate_slots, generate_pattern_slots, working_days
 
 router = APIRouter()
 
-def clean_mongo_doc(doc):
-    if not doc: return doc
-    new_doc = doc.copy()
-    if "_id" in new_doc:
-        new_doc["id"] = str(new_doc["_id"])
-        del new_doc["_id"]
-    for key, value in new_doc.items():
-        if isinstance(value, ObjectId):
-            new_doc[key] = str(value)
-    return new_doc
-
-@router.get("/all-doctors-full", response_model=List[UserModel])
-async def get_all_doctors_full(current_user: dict = Depends(get_current_user)):
+INSERT_BATCH_SIZE = int(os.getenv("SCHEDULE_INSERT_BATCH_SIZE", 1000))
+
+@router.get("/all-doctors-full", response_model=List[UserOut])
+async def get_all_doctors_full(current_user: dict = Depends(get_current_principal)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Brak uprawnień administratora")
     
-    doctors_cursor = user_collection.find({"role": "doctor"})
-    doctors = await doctors_cursor.to_list(length=100)
-    return doctors
+    return await user_crud.list_doctors(active_only=False)
+
+@router.get("/doctors/search")
+async def search_all_doctors(
+    q: Optional[str] = Query(None, max_length=100),
+    cursor: Optional[str] = None,
+    size: int = Query(20, ge=1, le=100),
+    with_free_slots: bool = False,
+    current_user: dict = Depends(get_current_principal)
+):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Brak uprawnień administratora")
+
+    return MongoJSONResponse(await search_doctors(q, cursor, size, with_free_slots, include_inactive=True))
+
+async def _insert_slots(batch: list) -> None:
+    await appointment_crud.insert_slots(batch)
+    await record_new_slots(batch)
 
 @router.post("/generate-bulk-schedule")
-async def generate_bulk_schedule(data: BulkScheduleCreate, current_user: dict = Depends(get_current_user)):
+async def generate_bulk_schedule(data: BulkScheduleCreate, current_user: dict = Depends(get_current_principal)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Tylko administrator może generować grafik")
 
-    doctor = await user_collection.find_one({"_id": ObjectId(data.doctor_id), "role": "doctor"})
+    doctor_oid = object_id(data.doctor_id, "Niepoprawny format ID lekarza")
+    doctor = await user_crud.get_doctor(doctor_oid, {"full_name": 1})
     if not doctor:
         raise HTTPException(status_code=404, detail="Nie znaleziono lekarza o podanym ID")
-    
-    doctor_oid = ObjectId(data.doctor_id)
 
     gen_start = data.start_time.replace(tzinfo=None)
     gen_end = data.end_time.replace(tzinfo=None)
 
-    formatted_breaks = [
-        {"start": b.start.replace(tzinfo=None), "end": b.end.replace(tzinfo=None)}
-        for b in data.breaks
+    blocked = [(b.start.replace(tzinfo=None), b.end.replace(tzinfo=None)) for b in data.breaks]
+
+    existing_appointments = await appointment_crud.find_overlapping(doctor_oid, gen_start, gen_end)
+    blocked.extend(
+        (appt["start_time"].replace(tzinfo=None), appt["end_time"].replace(tzinfo=None))
+        for appt in existing_appointments
+    )
+
+    created_at = datetime.utcnow()
+    new_slots = [
+        {
+            "doctor_id": doctor_oid,
+            "start_time": slot_start,
+            "end_time": slot_end,
+            "status": "available",
+            "patient_id": None,
+            "created_at": created_at,
+            "updated_at": created_at
+        }
+        for slot_start, slot_end in generate_slots(gen_start, gen_end, data.interval_minutes, blocked)
     ]
+    
+    if not new_slots:
+        raise HTTPException(status_code=400, detail="Nie wygenerowano nowych slotów. Wszytskie terminy kolidują z przerwami lub istniejącym grafikiem")
+    
+    await _insert_slots(new_slots)
+    count = len(new_slots)
+    invalidate("appointments")
+
+    return {
+        "message": f"Wygenerowano {count} slotów dla {doctor['full_name']}",
+        "count": count
+    }
+    
+@router.post("/generate-batch-schedule")
+async def generate_batch_schedule(data: BatchScheduleCreate, current_user: dict = Depends(get_current_principal)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Tylko administrator może generować grafik")
+
+    if data.date_to < data.date_from or data.day_end <= data.day_start:
+        raise HTTPException(status_code=400, detail="Niepoprawny zakres dat lub godzin pracy")
+
+    if any(d not in range(7) for d in data.weekdays):
+        raise HTTPException(status_code=400, detail="Dni tygodnia muszą mieścić się w zakresie 0-6")
 
-    existing_appointments = await appointment_collection.find({
-        "doctor_id": doctor_oid,
-        "start_time": {"$lt": gen_end},
-        "end_time": {"$gt": gen_start}
-    }).to_list(None)
+    doctor_oids = list(set(object_ids(data.doctor_ids, "Niepoprawny format ID lekarza")))
+    doctors = await user_crud.find_doctors(doctor_oids, {"full_name": 1})
+    found = {doc["_id"] for doc in doctors}
+    missing = [str(oid) for oid in doctor_oids if oid not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Nie znaleziono lekarzy: {', '.join(missing)}")
 
-    new_slots = []
-    current_slot_start = gen_start
+    days = working_days(data.date_from, data.date_to, data.weekdays)
+    if not days:
+        raise HTTPException(status_code=400, detail="W podanym zakresie nie ma dni pasujących do wzorca")
 
-    while current_slot_start + timedelta(minutes=data.interval_minutes) <= gen_end:
-        slot_end = current_slot_start + timedelta(minutes=data.interval_minutes)
+    range_start = datetime.combine(days[0], data.day_start)
+    range_end = datetime.combine(days[-1], data.day_end)
+    daily_breaks = [(b.start, b.end) for b in data.breaks]
 
-        is_during_break = any(
-            current_slot_start < b["end"] and slot_end > b["start"]
-            for b in formatted_breaks
+    existing_by_doctor = {oid: [] for oid in doctor_oids}
+    for appt in await appointment_crud.find_overlapping({"$in": doctor_oids}, range_start, range_end):
+        existing_by_doctor[appt["doctor_id"]].append(
+            (appt["start_time"].replace(tzinfo=None), appt["end_time"].replace(tzinfo=None))
         )
 
-        has_collision = any(
-            appt["start_time"].replace(tzinfo=None) < slot_end and 
-            appt["end_time"].replace(tzinfo=None) > current_slot_start
-            for appt in existing_appointments
+    created_at = datetime.utcnow()
+    counts = {}
+    batch = []
+    for doctor in doctors:
+        slots = generate_pattern_slots(
+            days, data.day_start, data.day_end, data.interval_minutes,
+            daily_breaks, existing_by_doctor[doctor["_id"]]
         )
+        counts[str(doctor["_id"])] = {"full_name": doctor.get("full_name"), "count": len(slots)}
 
-        if not is_during_break and not has_collision:
-            new_slots.append({
-                "doctor_id": doctor_oid,
-                "start_time": current_slot_start,
+        for slot_start, slot_end in slots:
+            batch.append({
+                "doctor_id": doctor["_id"],
+                "start_time": slot_start,
                 "end_time": slot_end,
                 "status": "available",
                 "patient_id": None,
-                "created_at": datetime.utcnow()
+                "created_at": created_at,
+                "updated_at": created_at
             })
-        
-        current_slot_start = slot_end
-    
-    if not new_slots:
-        raise HTTPException(status_code=400, detail="Nie wygenerowano nowych slotów. Wszytskie terminy kolidują z przerwami lub istniejącym grafikiem")
-    
-    result = await appointment_collection.insert_many(new_slots)
+            if len(batch) >= INSERT_BATCH_SIZE:
+                await _insert_slots(batch)
+                batch = []
+
+    if batch:
+        await _insert_slots(batch)
+    invalidate("appointments")
 
+    total = sum(entry["count"] for entry in counts.values())
     return {
-        "message": f"Wygenerowano {len(result.inserted_ids)} slotów dla {doctor['full_name']}",
-        "count": len(result.inserted_ids)
+        "message": f"Wygenerowano {total} slotów dla {len(counts)} lekarzy",
+        "count": total,
+        "doctors": counts
     }
-    
+
 @router.patch("/appointment/{appointment_id}")
-async def update_appointment(appointment_id: str, update_data: AppointmentUpdate, current_user: dict = Depends(get_current_user)):
+async def update_appointment(appointment_id: str, update_data: AppointmentUpdate, current_user: dict = Depends(get_current_principal)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Brak uprawnień admina")
 
-    if not ObjectId.is_valid(appointment_id):
-        raise HTTPException(status_code=400, detail="Niepoprawny format ID wizyty")
-    
-    current_appt = await appointment_collection.find_one({"_id": ObjectId(appointment_id)})
+    appointment_oid = object_id(appointment_id, "Niepoprawny format ID wizyty")
+    current_appt = await appointment_crud.get(appointment_oid, appointment_crud.INTERVAL | {"status": 1})
     if not current_appt:
         raise HTTPException(status_code=404, detail="Wizyta nie istnieje")
 
     update_dict = {k: v for k, v in update_data.model_dump().items() if v is not None}
 
-    new_doctor_id = ObjectId(update_dict["doctor_id"]) if "doctor_id"in update_dict else current_appt["doctor_id"]
+    new_doctor_id = object_id(update_dict["doctor_id"], "Niepoprawny format ID lekarza") if "doctor_id"in update_dict else current_appt["doctor_id"]
     new_start = update_dict["start_time"] if "start_time" in update_dict else current_appt["start_time"]
     new_end = update_dict["end_time"] if "end_time" in update_dict else current_appt["end_time"]
     
@@ -118,14 +180,7 @@ async def update_appointment(appointment_id: str, update_data: AppointmentUpdate
     new_end = new_end.replace(tzinfo=None)
 
     if "doctor_id" in update_dict or "start_time" in update_dict or "end_time" in update_dict:
-        collision_query = {
-            "_id": {"$ne": ObjectId(appointment_id)},
-            "doctor_id": new_doctor_id,
-            "start_time": {"$lt": new_end},
-            "end_time": {"$gt": new_start}
-        }
-        
-        collision = await appointment_collection.find_one(collision_query)
+        collision = await appointment_crud.find_collision(new_doctor_id, new_start, new_end, appointment_oid)
         if collision:
             raise HTTPException(
                 status_code=400, 
@@ -134,31 +189,155 @@ async def update_appointment(appointment_id: str, update_data: AppointmentUpdate
         
     if "doctor_id" in update_dict:
         update_dict["doctor_id"] = new_doctor_id
+    update_dict["updated_at"] = datetime.utcnow()
 
-    updated_result = await appointment_collection.find_one_and_update(
-        {"_id": ObjectId(appointment_id)},
-        {"$set": update_dict},
-        return_document=True
-    )
+    updated_result = await appointment_crud.update(appointment_oid, update_dict)
+    if updated_result:
+        await record_move(current_appt, updated_result)
+        await mark_dirty([current_appt])
+        invalidate("appointments")
         
-    return clean_mongo_doc(updated_result)
+    return MongoJSONResponse(updated_result)
+
+@router.post("/appointments/batch")
+async def batch_update_appointments(data: AppointmentBatch, current_user: dict = Depends(get_current_principal)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Brak uprawnień admina")
+
+    results = [
+        {"index": i, "appointment_id": item.appointment_id, "action": item.action, "status": "ok"}
+        for i, item in enumerate(data.items)
+    ]
+
+    def fail(i, detail):
+        if results[i]["status"] == "ok":
+            results[i]["status"] = "error"
+            results[i]["detail"] = detail
+
+    seen = set()
+    for i, item in enumerate(data.items):
+        if not is_object_id(item.appointment_id) or (item.doctor_id and not is_object_id(item.doctor_id)):
+            fail(i, "Niepoprawny format ID")
+        elif item.appointment_id in seen:
+            fail(i, "Wizyta występuje w paczce więcej niż raz")
+        seen.add(item.appointment_id)
+
+    ids = [object_id(item.appointment_id) for i, item in enumerate(data.items) if results[i]["status"] == "ok"]
+    current = {doc["_id"]: doc for doc in await appointment_crud.get_many(ids)}
+
+    # Docelowy stan każdej pozycji: (przed, po, zmiany do $set); po=None dla usunięcia
+    planned = {}
+    for i, item in enumerate(data.items):
+        if results[i]["status"] != "ok":
+            continue
+        before = current.get(object_id(item.appointment_id))
+        if before is None:
+            fail(i, "Wizyta nie istnieje")
+            continue
+        if item.action == "delete":
+            planned[i] = (before, None, None)
+            continue
+
+        changes = {k: v for k, v in item.model_dump(include={"doctor_id", "start_time", "end_time", "status"}).items() if v is not None}
+        if "doctor_id" in changes:
+            changes["doctor_id"] = object_id(changes["doctor_id"])
+        for field in ("start_time", "end_time"):
+            if field in changes:
+                changes[field] = changes[field].replace(tzinfo=None)
+        after = {**before, **changes}
+        if after["end_time"] <= after["start_time"]:
+            fail(i, "Koniec wizyty musi być po jej początku")
+            continue
+        planned[i] = (before, after, changes)
+
+    moved = {i for i, (before, after, changes) in planned.items()
+             if after is not None and {"doctor_id", "start_time", "end_time"} & changes.keys()}
+    if moved:
+        # Jedno zapytanie zakresowe na lekarza, kolizje liczone w pamięci
+        windows = {}
+        for i in moved:
+            after = planned[i][1]
+            low, high = windows.get(after["doctor_id"], (after["start_time"], after["end_time"]))
+            windows[after["doctor_id"]] = (min(low, after["start_time"]), max(high, after["end_time"]))
+
+        existing = {}
+        for doctor_id, (low, high) in windows.items():
+            existing[doctor_id] = await appointment_crud.find_overlapping(doctor_id, low, high)
+
+        batch_ids = {planned[i][0]["_id"] for i in planned}
+        while True:
+            intervals = {doctor_id: [] for doctor_id in windows}
+            for doctor_id, docs in existing.items():
+                intervals[doctor_id].extend(
+                    (doc["start_time"], doc["end_time"], ("db", doc["_id"]))
+                    for doc in docs if doc["_id"] not in batch_ids
+                )
+            for i, (before, after, _) in planned.items():
+                # Pozycje odrzucone zostają na starym miejscu i nadal blokują termin
+                slot = after if results[i]["status"] == "ok" else (before if after is not None else None)
+                if slot is not None and slot["doctor_id"] in intervals:
+                    intervals[slot["doctor_id"]].append((slot["start_time"], slot["end_time"], ("batch", i)))
+
+            newly_failed = False
+            for doctor_intervals in intervals.values():
+                for a, b in find_overlaps(doctor_intervals):
+                    for key, other in ((a, b), (b, a)):
+                        if key[0] == "batch" and key[1] in moved and results[key[1]]["status"] == "ok":
+                            fail(key[1], "Kolizja z inną wizytą lekarza" if other[0] == "db" else f"Kolizja z pozycją {other[1]} w paczce")
+                            newly_failed = True
+            if not newly_failed:
+                break
+
+    writes = [(i, before, after, changes) for i, (before, after, changes) in planned.items()
+              if results[i]["status"] == "ok" and (after is None or changes)]
+    flags, error = await appointment_crud.write_batch(
+        [(before, changes if after is not None else None) for _, before, after, changes in writes],
+        datetime.utcnow()
+    )
+
+    applied = []
+    for position, ((i, before, after, _), done) in enumerate(zip(writes, flags)):
+        if done:
+            applied.append((before, after))
+        elif error is not None and position == error[0]:
+            fail(i, f"Błąd zapisu: {error[1]}")
+        elif error is not None and position > error[0]:
+            fail(i, "Nie wykonano - wcześniejsza pozycja paczki zakończyła się błędem")
+        else:
+            fail(i, "Wizyta została zmieniona w międzyczasie")
+
+    # Podsumowania i rollupy aktualizujemy tylko dla zapisów, które faktycznie weszły
+    if applied:
+        await record_changes(applied)
+        await mark_dirty(before for before, _ in applied)
+        invalidate("appointments")
+
+    return {
+        "applied": len(applied),
+        "failed": sum(1 for r in results if r["status"] != "ok"),
+        "results": results
+    }
 
 @router.delete("/appointment/{appointment_id}")
-async def delete_appointment(appointment_id: str, current_user: dict = Depends(get_current_user)):
+async def delete_appointment(appointment_id: str, current_user: dict = Depends(get_current_principal)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Brak uprawnień admina")
     
-    result = await appointment_collection.delete_one({"_id": ObjectId(appointment_id)})
+    deleted = await appointment_crud.delete(object_id(appointment_id, "Niepoprawny format ID wizyty"))
 
-    if result.deleted_count == 0:
+    if not deleted:
         raise HTTPException(status_code=404, detail="Nie znaleziono wizyty do usunięcia")
+
+    await record_transition(deleted["doctor_id"], deleted["start_time"], deleted.get("status"), None)
+    await mark_dirty([deleted])
+    invalidate("appointments")
     
     return {"message": "Wizyta została pomyślnie usunięta"}
 
 @router.post("/register-doctor", response_model=UserOut)
 async def register_doctor(
     user_data: UserCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_principal)
 ):
     if current_user.get("role") != "admin":
         raise HTTPException(
@@ -166,33 +345,28 @@ async def register_doctor(
             detail="Tylko administrator może rejestrować lekarzy"
         )
     
-    existing_user = await user_collection.find_one({"email": user_data.email})
-    if existing_user:
+    if await user_crud.email_taken(user_data.email):
         raise HTTPException(status_code=400, detail="Użytkownik o tym emailu już istnieje")
     
     user_dict = user_data.model_dump()
-    user_dict["hashed_password"] = hash_password(user_dict.pop("password"))
+    user_dict["hashed_password"] = await hash_password_async(user_dict.pop("password"))
     user_dict["is_active"] = True
     user_dict["role"] = "doctor"
+    user_dict.update(search_fields(user_dict["full_name"], user_dict["email"]))
 
-    new_user = await user_collection.insert_one(user_dict)
-    created_user = await user_collection.find_one({"_id": new_user.inserted_id})
+    created_user = await user_crud.create(user_dict)
+    invalidate("doctors")
     return created_user
 
-@router.get("/doctor/{doctor_id}", response_model=UserModel)
-async def get_doctor_by_id(doctor_id: str, current_user: dict = Depends(get_current_user)):
+@router.get("/doctor/{doctor_id}", response_model=UserOut)
+async def get_doctor_by_id(doctor_id: str, current_user: dict = Depends(get_current_principal)):
     if current_user.get("role") != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Brak uprawnień administratora"
         )
     
-    try:
-        obj_id = ObjectId(doctor_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Nieprawiodłowy format ID")
-    
-    doctor = await user_collection.find_one({"_id": obj_id, "role": "doctor"})
+    doctor = await user_crud.get_doctor(object_id(doctor_id, "Nieprawiodłowy format ID"))
 
     if not doctor:
         raise HTTPException(status_code=404, detail="Nie znaleziono lekarza o podanym ID")
@@ -202,59 +376,167 @@ async def get_doctor_by_id(doctor_id: str, current_user: dict = Depends(get_curr
 @router.get("/doctor/{doctor_id}/appointments")
 async def get_doctor_schedule_by_id(doctor_id: str):
     try: 
-        if not ObjectId.is_valid(doctor_id):
-            raise HTTPException(status_code=400, detail="Niepoprawne ID lekarza")
-
-        query = {"doctor_id": ObjectId(doctor_id)}
-        schedule = await appointment_collection.find(query).sort("start_time", 1).to_list(1000)
-        return [clean_mongo_doc(doc) for doc in schedule]
+        schedule = await appointment_crud.list_for_doctor(object_id(doctor_id, "Niepoprawne ID lekarza"), limit=1000)
+        return MongoJSONResponse(schedule)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Błąd podczas pobierania wizyt: {str(e)}")
     
+@router.get("/doctor/{doctor_id}/appointments/export")
+async def export_doctor_schedule_by_id(
+    doctor_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: dict = Depends(get_current_principal)
+):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Brak uprawnień administratora")
+
+    return stream_cursor(
+        appointment_crud.export_cursor({"doctor_id": object_id(doctor_id, "Niepoprawne ID lekarza")}, EXPORT_BATCH_SIZE),
+        appointment_crud.EXPORTED,
+        format,
+        f"grafik-{doctor_id}"
+    )
+
+def _rollup_stages(date_from: date, date_to: date, doctor_id: Optional[str], group_id: dict) -> list:
+    query = {"date": {
+        "$gte": datetime.combine(date_from, datetime.min.time()),
+        "$lt": datetime.combine(date_to + timedelta(days=1), datetime.min.time()),
+    }}
+    if doctor_id is not None:
+        query["doctor_id"] = object_id(doctor_id, "Niepoprawne ID lekarza")
+
+    return [
+        {"$match": query},
+        {"$group": {
+            "_id": group_id,
+            "slots": {"$sum": "$slots"},
+            "available": {"$sum": "$available"},
+            "booked": {"$sum": "$booked"},
+            "completed": {"$sum": "$completed"},
+            "cancellations": {"$sum": "$cancellations"},
+            "lead_time_hours_sum": {"$sum": "$lead_time_hours_sum"},
+            "lead_time_count": {"$sum": "$lead_time_count"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "doctor_id": "$_id.doctor_id",
+            "period": "$_id.period",
+            "slots": 1, "available": 1, "booked": 1, "completed": 1, "cancellations": 1,
+            "booking_rate": {"$cond": [
+                {"$gt": ["$slots", 0]}, {"$divide": [{"$add": ["$booked", "$completed"]}, "$slots"]}, 0
+            ]},
+            "avg_lead_time_hours": {"$cond": [
+                {"$gt": ["$lead_time_count", 0]}, {"$divide": ["$lead_time_hours_sum", "$lead_time_count"]}, None
+            ]},
+        }},
+    ]
+
+@router.get("/analytics/utilization")
+async def get_utilization(
+    date_from: date,
+    date_to: date,
+    granularity: str = Query("day", pattern="^(day|week)$"),
+    doctor_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_principal)
+):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Brak uprawnień administratora")
+
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="Niepoprawny zakres dat")
+
+    # Rollupy są dzienne - tygodnie (od poniedziałku) składamy przy odczycie
+    period = "$date" if granularity == "day" else {"$dateTrunc": {"date": "$date", "unit": "week", "startOfWeek": "monday"}}
+    pipeline = _rollup_stages(date_from, date_to, doctor_id, {"doctor_id": "$doctor_id", "period": period})
+    pipeline.append({"$sort": {"period": 1, "doctor_id": 1}})
+
+    return MongoJSONResponse(await analytics_crud.aggregate(pipeline))
+
+@router.get("/analytics/doctors")
+async def get_doctor_analytics(
+    date_from: date,
+    date_to: date,
+    current_user: dict = Depends(get_current_principal)
+):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Brak uprawnień administratora")
+
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="Niepoprawny zakres dat")
+
+    pipeline = _rollup_stages(date_from, date_to, None, {"doctor_id": "$doctor_id"})
+    pipeline.append({"$sort": {"completed": -1, "doctor_id": 1}})
+    rows = await analytics_crud.aggregate(pipeline)
+
+    names = await user_crud.names(row["doctor_id"] for row in rows)
+    for row in rows:
+        row.pop("period", None)
+        row["full_name"] = names.get(row["doctor_id"])
+
+    return MongoJSONResponse(rows)
+
+@router.post("/analytics/refresh")
+async def refresh_analytics(full: bool = False, current_user: dict = Depends(get_current_principal)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Brak uprawnień administratora")
+
+    report = await refresh_rollups(full=full)
+    if report is None:
+        raise HTTPException(status_code=409, detail="Odświeżanie statystyk jest już w toku")
+
+    return MongoJSONResponse(report)
+
+@router.post("/maintenance/archive")
+async def run_archival(current_user: dict = Depends(get_current_principal)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Brak uprawnień administratora")
+
+    report = await archive_appointments()
+    if report is None:
+        raise HTTPException(status_code=409, detail="Archiwizacja jest już w toku")
+
+    return report
+    
 @router.post("/admin-reset-password")
-async def admin_reset_password(data: AdminPasswordReset, current_user: dict = Depends(get_current_user)):
+async def admin_reset_password(data: AdminPasswordReset, current_user: dict = Depends(get_current_principal)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Tylko administrator może resetować hasła")
     
-    if not ObjectId.is_valid(data.user_id):
-        raise HTTPException(status_code=400, detail="Niepoprawny format ID użytkownika")
-    
-    user = await user_collection.find_one({"_id": ObjectId(data.user_id)})
+    user_oid = object_id(data.user_id, "Niepoprawny format ID użytkownika")
+    user = await user_crud.get(user_oid, {"email": 1})
     if not user:
         raise HTTPException(status_code=404, detail="Użytkownik nie istnieje")
     
-    new_hashed_password = hash_password(data.new_password)
+    new_hashed_password = await hash_password_async(data.new_password)
 
-    await user_collection.update_one(
-        {"_id": ObjectId(data.user_id)},
-        {"$set": {"hashed_password": new_hashed_password}}
-    )
+    await user_crud.update(user_oid, {"hashed_password": new_hashed_password})
+    invalidate_principal(data.user_id)
 
     return {"message": f"Hasło dla użytkownika {user['email']} został pomyślnei zmienione"}
 
 @router.patch("/doctor/{doctor_id}/toggle-activity")
-async def toggle_doctor_activity(doctor_id: str, current_user: dict = Depends(get_current_user)):
+async def toggle_doctor_activity(doctor_id: str, current_user: dict = Depends(get_current_principal)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Brak uprawnień administratora")
     
-    doctor = await user_collection.find_one({"_id": ObjectId(doctor_id)})
+    doctor_oid = object_id(doctor_id)
+    doctor = await user_crud.get(doctor_oid, {"is_active": 1})
+    if not doctor:
+        raise HTTPException(status_code=404, detail="Nie znaleziono lekarza o podanym ID")
     new_status = not doctor.get("is_active", True)
-    await user_collection.update_one(
-        {"_id": ObjectId(doctor_id)},
-        {"$set": {"is_active": new_status}}
-    )
+    await user_crud.update(doctor_oid, {"is_active": new_status})
+    invalidate_principal(doctor_id)
+    invalidate("doctors")
 
     return {"message": "Status zmieniony", "is_active": new_status}
 
 @router.put("/doctor/{doctor_id}")
-async def update_doctor(doctor_id: str, update_data: DoctorUpdate, current_user: dict = Depends(get_current_user)):
+async def update_doctor(doctor_id: str, update_data: DoctorUpdate, current_user: dict = Depends(get_current_principal)):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Brak uprawnień administratora")
     
-    if not ObjectId.is_valid(doctor_id):
-        raise HTTPException(status_code=400, detail="Niepoprawny format ID")
-    
-    user_in_db = await user_collection.find_one({"_id": ObjectId(doctor_id)})
+    doctor_oid = object_id(doctor_id)
+    user_in_db = await user_crud.get(doctor_oid, {"email": 1, "role": 1})
     
     if not user_in_db:
         raise HTTPException(status_code=404, detail="Użytkownik o podanym ID nie istnieje")
@@ -263,16 +545,15 @@ async def update_doctor(doctor_id: str, update_data: DoctorUpdate, current_user:
         raise HTTPException(status_code=400, detail=f"Ten użytkownik nie jest lekarzem (rola: {user_in_db.get('role')})")
 
     if update_data.email != user_in_db["email"]:
-        existing_email = await user_collection.find_one({"email": update_data.email})
-        if existing_email:
+        if await user_crud.email_taken(update_data.email):
             raise HTTPException(status_code=400, detail="Ten email jest już zajęty")
         
-    await user_collection.update_one(
-        {"_id": ObjectId(doctor_id)},
-        {"$set": {
-            "full_name": update_data.full_name,
-            "email": update_data.email
-        }}
-    )
+    await user_crud.update(doctor_oid, {
+        "full_name": update_data.full_name,
+        "email": update_data.email,
+        **search_fields(update_data.full_name, update_data.email)
+    })
+    invalidate_principal(doctor_id)
+    invalidate("doctors")
 
     return {"message": "Dane lekarza zostały zaktualizowane"}
\ No newline at end of file
@@ -1,11 +1,140 @@
-from fastapi import APIRouter
-from typing import List
-from ..database import appointment_collection
+import asyncio
+import heapq
+import os
+from fastapi import APIRouter, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from datetime import datetime
+from ..crud import appointments as appointment_crud, availability_summaries as summary_crud, users as user_crud
+from ..crud.ids import object_id, object_ids
 from ..schemas.appointment_dto import AppointmentOut
+from ..schemas.common import PaginationResponse
+from ..pagination import encode_cursor, keyset_filter
+from ..serialization import MongoJSONResponse
+from ..response_cache import cached_response
+from ..live import RESYNC, Subscription, broadcaster, format_event
 
 router = APIRouter()
 
-@router.get("/available", response_model=List[AppointmentOut])
-async def get_available_appointments():
-    cursor = appointment_collection.find({}).sort("start_time", 1)
-    return await cursor.to_list(length=100)
\ No newline at end of file
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", 15))
+# Do tylu lekarzy łączymy osobne kursory (k-way merge), powyżej - jedno zapytanie po indeksie czasu
+EARLIEST_MERGE_MAX_DOCTORS = int(os.getenv("EARLIEST_MERGE_MAX_DOCTORS", 20))
+
+@router.get("/available", response_model=PaginationResponse[AppointmentOut])
+async def get_available_appointments(
+    request: Request,
+    status: str = Query("available"),
+    doctor_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    size: int = Query(50, ge=1, le=500),
+    include_total: bool = False,
+):
+    query = {"status": status}
+
+    if doctor_id is not None:
+        query["doctor_id"] = object_id(doctor_id, "Niepoprawne ID lekarza")
+
+    time_range = {}
+    if date_from is not None:
+        time_range["$gte"] = date_from.replace(tzinfo=None)
+    if date_to is not None:
+        time_range["$lt"] = date_to.replace(tzinfo=None)
+    if time_range:
+        query["start_time"] = time_range
+
+    async def load_page() -> bytes:
+        items = await appointment_crud.page(query, keyset_filter("start_time", cursor), size + 1)
+
+        next_cursor = None
+        if len(items) > size:
+            items = items[:size]
+            next_cursor = encode_cursor(items[-1]["start_time"], items[-1]["_id"])
+
+        total = await appointment_crud.count(query) if include_total else None
+
+        page = PaginationResponse[AppointmentOut].model_validate(
+            {"items": items, "total": total, "size": size, "next_cursor": next_cursor}
+        )
+        return page.model_dump_json(by_alias=True).encode("utf-8")
+
+    return await cached_response(request, "appointments", load_page)
+
+@router.get("/earliest", response_model=List[AppointmentOut])
+async def get_earliest_available(
+    after: Optional[datetime] = None,
+    limit: int = Query(10, ge=1, le=100),
+    doctor_ids: Optional[List[str]] = Query(None),
+):
+    after = after.replace(tzinfo=None) if after else datetime.utcnow()
+
+    active = await user_crud.active_doctor_ids(object_ids(doctor_ids or [], "Niepoprawne ID lekarza"))
+    if not active:
+        return []
+
+    if len(active) <= EARLIEST_MERGE_MAX_DOCTORS:
+        per_doctor = await asyncio.gather(*(
+            appointment_crud.earliest_available([doctor_id], after, limit) for doctor_id in active
+        ))
+        merged = heapq.merge(*per_doctor, key=lambda doc: (doc["start_time"], doc["_id"]))
+        return [doc for _, doc in zip(range(limit), merged)]
+
+    return await appointment_crud.earliest_available(active, after, limit)
+
+@router.get("/availability-summary")
+async def get_availability_summary(
+    year: int = Query(..., ge=2000, le=2100),
+    month: int = Query(..., ge=1, le=12),
+    doctor_id: Optional[str] = None,
+):
+    month_start = datetime(year, month, 1)
+    month_end = datetime(year + month // 12, month % 12 + 1, 1)
+    days = await summary_crud.list_for_month(
+        month_start, month_end, object_id(doctor_id, "Niepoprawne ID lekarza") if doctor_id is not None else None
+    )
+
+    for day in days:
+        day["date"] = day["date"].date()
+        for status in ("available", "booked", "completed"):
+            day.setdefault(status, 0)
+
+    return MongoJSONResponse(days)
+
+@router.get("/live")
+async def stream_schedule_updates(
+    request: Request,
+    doctor_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    last_event_id: Optional[str] = Header(None),
+):
+    subscription = Subscription(
+        object_id(doctor_id, "Niepoprawne ID lekarza") if doctor_id is not None else None,
+        date_from.replace(tzinfo=None) if date_from else None,
+        date_to.replace(tzinfo=None) if date_to else None,
+    )
+    broadcaster.subscribe(subscription, last_event_id)
+
+    async def events():
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscription.queue.get(), LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield b": ping\n\n"
+                    continue
+                yield format_event(item)
+                if item is RESYNC:
+                    break
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
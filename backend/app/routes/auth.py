@@ -2,38 +2,38 @@ import os
 from dotenv import load_dotenv
 from fastapi import APIRouter, HTTPException, status, Depends, Body
 from fastapi.security import OAuth2PasswordRequestForm
-from ..database import user_collection
+from ..crud import users as user_crud
+from ..rate_limit import limit_login, limit_register
 from ..schemas.user_dto import UserCreate, UserOut
-from ..auth.security import hash_password, verify_password, create_access_token
+from ..auth.security import hash_password_async, verify_password_async, needs_rehash, create_access_token
 
 router = APIRouter()
 load_dotenv()
 
-@router.post("/register", response_model=UserOut)
+@router.post("/register", response_model=UserOut, dependencies=[Depends(limit_register)])
 async def register(user_data: UserCreate):
-    existing_user = await user_collection.find_one({"email": user_data.email})
-    if existing_user:
+    if await user_crud.email_taken(user_data.email):
         raise HTTPException(status_code=400, detail="Użytkownik o tym emailu już istnieje")
     
     user_dict = user_data.model_dump()
-    user_dict["hashed_password"] = hash_password(user_dict.pop("password"))
+    user_dict["hashed_password"] = await hash_password_async(user_dict.pop("password"))
     user_dict["is_active"] = True
     user_dict["role"] = "patient"
 
-    new_user = await user_collection.insert_one(user_dict)
+    return await user_crud.create(user_dict)
 
-    created_user = await user_collection.find_one({"_id": new_user.inserted_id})
-    return created_user
-
-@router.post("/login")
+@router.post("/login", dependencies=[Depends(limit_login)])
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = await user_collection.find_one({"email": form_data.username})
+    user = await user_crud.find_for_login(form_data.username)
 
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    if not user or not await verify_password_async(form_data.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Niepoprawny email lub hasło"
         )
+
+    if needs_rehash(user["hashed_password"]):
+        await user_crud.update(user["_id"], {"hashed_password": await hash_password_async(form_data.password)})
     
     is_active_status = user.get("is_active", True)
     
@@ -53,19 +53,17 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         }
     }
 
-@router.post("/setup-admin-secret", response_model=UserOut, include_in_schema=False)
+@router.post("/setup-admin-secret", response_model=UserOut, include_in_schema=False, dependencies=[Depends(limit_register)])
 async def setup_admin_secret(user_data: UserCreate, x_admin_key: str = Body(...)):
     if x_admin_key != os.getenv("ADMIN_KEY", "moje-tajne-haslo-123"):
         raise HTTPException(status_code=403, detail="Niepoprawny klucz instalacyjny")
 
-    existing_user = await user_collection.find_one({"email": user_data.email})
-    if existing_user:
+    if await user_crud.email_taken(user_data.email):
         raise HTTPException(status_code=400, detail="Admin o tym emailu już istnieje")
 
     user_dict = user_data.model_dump()
-    user_dict["hashed_password"] = hash_password(user_dict.pop("password"))
+    user_dict["hashed_password"] = await hash_password_async(user_dict.pop("password"))
     user_dict["is_active"] = True
     user_dict["role"] = "admin"  
 
-    new_user = await user_collection.insert_one(user_dict)
-    return await user_collection.find_one({"_id": new_user.inserted_id})
\ No newline at end of file
+    return await user_crud.create(user_dict)
\ No newline at end of file
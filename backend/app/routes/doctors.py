@@ -1,88 +1,145 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query
 from datetime import datetime
-from ..database import appointment_collection, medical_history_collection, user_collection
-from ..schemas.appointment_dto import AppointmentCreate, AppointmentOut
+from typing import Optional
+from ..crud import appointments as appointment_crud, medical_histories as history_crud, users as user_crud
+from ..crud.ids import object_id
 from ..schemas.medical_history_dto import MedicalHistoryCreate, MedicalHistoryOut
-from ..auth.deps import get_current_user
+from ..auth.deps import get_current_principal
+from ..serialization import MongoJSONResponse
+from ..analytics import mark_dirty
+from ..availability import record_transition
+from ..export import EXPORT_BATCH_SIZE, stream_cursor, stream_export
+from ..response_cache import invalidate
+from ..pagination import encode_cursor, keyset_filter
 
 router = APIRouter()
 
-def clean_mongo_doc(doc):
-    if not doc:
-        return doc
-    new_doc = doc.copy()
-    if "_id" in new_doc:
-        new_doc["id"] = str(new_doc["_id"])
-    for key, value in new_doc.items():
-        if isinstance(value, ObjectId):
-            new_doc[key] = str(value)
-        elif isinstance(value, dict):
-            new_doc[key] = clean_mongo_doc(value)
-    return new_doc
-
 @router.get("/my-schedule")
-async def get_doctor_schedule(current_user: dict = Depends(get_current_user)):
+async def get_doctor_schedule(include_history: bool = False, current_user: dict = Depends(get_current_principal)):
     if current_user["role"] != "doctor":
         raise HTTPException(status_code=403, detail="Brak dostępu")
     
-    query = {"doctor_id": ObjectId(current_user["_id"])}
-    schedule = await appointment_collection.find(query).sort("start_time", 1).to_list(500)
-    return [clean_mongo_doc(doc) for doc in schedule]
+    schedule = await appointment_crud.list_for_doctor(object_id(current_user["_id"]), include_history=include_history)
+    return MongoJSONResponse(schedule)
+
+@router.get("/my-schedule/export")
+async def export_doctor_schedule(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: dict = Depends(get_current_principal)
+):
+    if current_user["role"] != "doctor":
+        raise HTTPException(status_code=403, detail="Brak dostępu")
+
+    return stream_cursor(
+        appointment_crud.export_cursor({"doctor_id": object_id(current_user["_id"])}, EXPORT_BATCH_SIZE),
+        appointment_crud.EXPORTED,
+        format,
+        "grafik"
+    )
+
+@router.get("/history-search")
+async def search_medical_histories(
+    q: str = Query(..., min_length=2, max_length=200),
+    patient_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    size: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_principal)
+):
+    if current_user["role"] != "doctor":
+        raise HTTPException(status_code=403, detail="Tylko lekarz może przeglądac historię pacjentów")
+
+    # Bez wskazania pacjenta przeszukujemy wyłącznie wpisy bieżącego lekarza
+    if patient_id is not None:
+        scope = {"patient_id": object_id(patient_id, "Niepoprane ID pacjenta")}
+    else:
+        scope = {"doctor_id": object_id(current_user["_id"])}
+
+    items = await history_crud.search(q, scope, keyset_filter("score", cursor, direction=-1), size + 1)
+
+    next_cursor = None
+    if len(items) > size:
+        items = items[:size]
+        next_cursor = encode_cursor(items[-1]["score"], items[-1]["_id"])
+
+    return MongoJSONResponse({"items": items, "size": size, "next_cursor": next_cursor})
+
+@router.get("/patient-history/{patient_id}/export")
+async def export_patient_history(
+    patient_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: dict = Depends(get_current_principal)
+):
+    if current_user["role"] != "doctor":
+        raise HTTPException(status_code=403, detail="Tylko lekarz może przeglądac historię pacjentów")
+
+    return stream_export(
+        history_crud.read_collection,
+        {"patient_id": object_id(patient_id, "Niepoprane ID pacjenta")},
+        ["_id", "date", "doctor_id", "appointment_id", "diagnosis", "treatment_notes", "recommendations"],
+        [("date", -1)],
+        format,
+        f"historia-{patient_id}"
+    )
 
 @router.get("/patient-history/{patient_id}")
-async def get_patient_history(patient_id: str, current_user: dict = Depends(get_current_user)):
+async def get_patient_history(patient_id: str, current_user: dict = Depends(get_current_principal)):
     if current_user["role"] != "doctor":
         raise HTTPException(status_code=403, detail="Tylko lekarz może przeglądac historię pacjentów")
     
-    if not ObjectId.is_valid(patient_id):
-        raise HTTPException(status_code=400, detail="Niepoprane ID pacjenta")
-    
-    history = await medical_history_collection.find({"patient_id": patient_id}).sort("date", -1).to_list(100)
+    history = await history_crud.list_for_patient(object_id(patient_id, "Niepoprane ID pacjenta"))
 
-    return [clean_mongo_doc(doc) for doc in history]
+    return MongoJSONResponse(history)
 
 @router.post("/add-history", response_model=MedicalHistoryOut)
 async def add_medical_history(
     data: MedicalHistoryCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_principal)
 ): 
     if current_user["role"] != "doctor":
         raise HTTPException(status_code=403, detail="Tylko lekarz może dodwać wpisy")
     
-    appointment = await appointment_collection.find_one({"_id": ObjectId(data.appointment_id)})
-    if not appointment or str(appointment["doctor_id"]) != str(current_user["_id"]):
-        raise HTTPException(status_code=404, detail="Wizyta nie znaleziona lub nie należy do Ciebie")
-
+    appointment_oid = object_id(data.appointment_id)
+    doctor_oid = object_id(current_user["_id"])
+    now = datetime.utcnow()
     history_doc = data.model_dump()
-    history_doc["doctor_id"] = ObjectId(current_user["_id"])
-    history_doc["date"] = datetime.utcnow()
-
-    new_history = await medical_history_collection.insert_one(history_doc)
-    saved_history = await medical_history_collection.find_one({"_id": new_history.inserted_id})
-    await appointment_collection.update_one(
-        {"_id": ObjectId(data.appointment_id)},
-        {"$set": {"status": "completed"}}
-    )
+    history_doc["patient_id"] = object_id(data.patient_id)
+    history_doc["appointment_id"] = appointment_oid
+    history_doc["doctor_id"] = doctor_oid
+    history_doc["date"] = now
+
+    appointment = await appointment_crud.complete_with_history(appointment_oid, doctor_oid, history_doc, now)
+    if appointment is None:
+        appointment = await appointment_crud.get_with_archive(appointment_oid, appointment_crud.TRANSITION)
+        if not appointment or appointment["doctor_id"] != doctor_oid:
+            raise HTTPException(status_code=404, detail="Wizyta nie znaleziona lub nie należy do Ciebie")
+        if appointment.get("patient_id") != history_doc["patient_id"]:
+            raise HTTPException(status_code=400, detail="Wizyta nie dotyczy wskazanego pacjenta")
+        raise HTTPException(status_code=400, detail="Wizyta nie jest zarezerwowana lub została już zakończona")
+
+    await record_transition(appointment["doctor_id"], appointment["start_time"], "booked", "completed")
+    if appointment.get("archived_at"):
+        # Zmiany w archiwum nie są wykrywane po updated_at kolekcji appointments
+        await mark_dirty([appointment])
+    invalidate("appointments")
 
-    return clean_mongo_doc(saved_history)
+    # Słownik przechodzi przez response_model - odpowiedź ma dokładnie kształt MedicalHistoryOut
+    return history_doc
 
 @router.get("/appointment-detail/{appointment_id}")
-async def get_appointment_detail(appointment_id: str, current_user: dict = Depends(get_current_user)):
+async def get_appointment_detail(appointment_id: str, current_user: dict = Depends(get_current_principal)):
     if current_user.get("role") != "doctor":
         raise HTTPException(status_code=403, detail="Brak uprawnień")
     
-    appt = await appointment_collection.find_one({"_id": ObjectId(appointment_id)})
+    appt = await appointment_crud.get_with_archive(object_id(appointment_id, "Niepoprawny format ID wizyty"))
     if not appt:
         raise HTTPException(status_code=404, detail="Nie znaleziono wizyty")
     
-    patient = await user_collection.find_one({"_id": appt["patient_id"]})
+    patient = await user_crud.get(appt["patient_id"], user_crud.CONTACT) if appt.get("patient_id") else None
 
-    result = clean_mongo_doc(appt)
     if patient:
-        result["patient_data"] = {
+        appt["patient_data"] = {
             "full_name": patient.get("full_name"),
             "email": patient.get("email")
         }
 
-    return result
\ No newline at end of file
+    return MongoJSONResponse(appt)
\ No newline at end of file
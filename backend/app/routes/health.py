@@ -0,0 +1,34 @@
+import asyncio
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from ..database import get_client, pool_stats, verify_indexes
+
+router = APIRouter()
+
+@router.get("/live")
+async def liveness():
+    return {"status": "ok"}
+
+@router.get("/ready")
+async def readiness(request: Request):
+    report = {
+        "status": "ok",
+        "warmed_up": getattr(request.app.state, "ready", False),
+        "transactions": getattr(request.app.state, "transactions", False),
+        "pool": pool_stats.snapshot(),
+    }
+
+    try:
+        await asyncio.wait_for(get_client().admin.command("ping"), timeout=2)
+        report["database"] = "ok"
+        missing = await asyncio.wait_for(verify_indexes(), timeout=2)
+        report["missing_indexes"] = missing
+    except Exception as e:
+        report["database"] = f"error: {e.__class__.__name__}"
+        missing = None
+
+    if not report["warmed_up"] or not report["transactions"] or report["database"] != "ok" or missing:
+        report["status"] = "unavailable"
+        return JSONResponse(status_code=503, content=report)
+
+    return report
@@ -1,119 +1,100 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pydantic import TypeAdapter
 from typing import List, Optional
-from bson import ObjectId
 from datetime import datetime, timedelta
-from ..database import appointment_collection, medical_history_collection, user_collection
+from ..crud import appointments as appointment_crud, medical_histories as history_crud, users as user_crud
+from ..crud.ids import object_id
 from ..schemas.user_dto import UserOut
 from ..schemas.appointment_dto import AppointmentOut, AppointmentDetails
 from ..schemas.medical_history_dto import MedicalHistoryOut
-from ..auth.deps import get_current_user
+from ..auth.deps import get_current_principal
+from ..serialization import MongoJSONResponse
+from ..availability import record_transition
+from ..response_cache import cached_response, invalidate
+from ..doctor_search import search_doctors
 
 router = APIRouter()
 
-def clean_mongo_doc(doc):
-    if not doc:
-        return doc
-    
-    new_doc = doc.copy()
-    
-    if "_id" in new_doc:
-        new_doc["id"] = str(new_doc["_id"])
-        
-    for key, value in new_doc.items():
-        if isinstance(value, ObjectId):
-            new_doc[key] = str(value)
-        elif isinstance(value, dict):
-            new_doc[key] = clean_mongo_doc(value)
-            
-    return new_doc
+doctor_list_adapter = TypeAdapter(List[UserOut])
 
 @router.get("/doctors", response_model=List[UserOut])
-async def get_all_doctors():
-    doctors = await user_collection.find({"role": "doctor", "is_active": True}).to_list(100)
-    return doctors
+async def get_all_doctors(request: Request):
+    async def load_doctors() -> bytes:
+        doctors = await user_crud.list_doctors()
+        return doctor_list_adapter.dump_json(doctor_list_adapter.validate_python(doctors), by_alias=True)
+
+    return await cached_response(request, "doctors", load_doctors)
+
+@router.get("/doctors/search")
+async def search_active_doctors(
+    q: Optional[str] = Query(None, max_length=100),
+    cursor: Optional[str] = None,
+    size: int = Query(20, ge=1, le=100),
+    with_free_slots: bool = False,
+):
+    return MongoJSONResponse(await search_doctors(q, cursor, size, with_free_slots))
 
 @router.get("/my-appointments")
-async def get_my_appointments(current_user: dict = Depends(get_current_user)):
+async def get_my_appointments(include_history: bool = False, current_user: dict = Depends(get_current_principal)):
     if current_user.get("role") != "patient":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Ten endpoint jest przeznaczony wyłącznie dla pacjentów")
-    query = {"patient_id": ObjectId(current_user["_id"])}
-    appointments = await appointment_collection.find(query).sort("start_time", -1).to_list(100)
+    appointments = await appointment_crud.list_for_patient(object_id(current_user["_id"]), include_history=include_history)
 
-    results = []
+    histories = await history_crud.by_appointment([appt["_id"] for appt in appointments])
     for appt in appointments:
-        appt_data = clean_mongo_doc(appt)
-
-        history = await medical_history_collection.find_one({"appointment_id": str(appt["_id"])})
-        if history:
-            appt_data["medical_history"] = clean_mongo_doc(history)
-        else:
-            appt_data["medical_history"] = None
-        
-        results.append(appt_data)
+        appt["medical_history"] = histories.get(appt["_id"])
     
-    return results
+    return MongoJSONResponse(appointments)
 
 @router.patch("/cancel-appointment/{appointment_id}")
 async def cancel_appointment(
     appointment_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_principal)
 ):
-    appt = await appointment_collection.find_one({"_id": ObjectId(appointment_id)})
-    
-    if not appt:
-        raise HTTPException(status_code=404, detail="Nie znaleziono wizyty")
-    
-    if str(appt.get("patient_id")) != str(current_user["_id"]):
-        raise HTTPException(status_code=403, detail="To nie jest Twoja wizyta")
-    
+    appointment_oid = object_id(appointment_id, "Niepoprawny format ID wizyty")
     now = datetime.utcnow()
-    appointment_time = appt["start_time"]
+    deadline = now + timedelta(days=1)
 
-    if appointment_time < now + timedelta(days=1):
-        raise HTTPException(status_code=400, detail="Wizytę można odwołać najpóźniej na 24 godziny przed jej rozpoczęciem")
-    
-    await appointment_collection.update_one(
-        {"_id": ObjectId(appointment_id)},
-        {
-            "$set": {
-                "status": "available",
-                "patient_id": None,
-                "details": None
-            }
-        }
-    )
+    appt = await appointment_crud.cancel(appointment_oid, object_id(current_user["_id"]), deadline, now)
+    if appt is None:
+        # Odczyt tylko na ścieżce błędu - by wskazać, który warunek nie został spełniony
+        appt = await appointment_crud.get(appointment_oid, appointment_crud.TRANSITION)
+        if not appt:
+            raise HTTPException(status_code=404, detail="Nie znaleziono wizyty")
+        if str(appt.get("patient_id")) != str(current_user["_id"]):
+            raise HTTPException(status_code=403, detail="To nie jest Twoja wizyta")
+        if appt["start_time"] < deadline:
+            raise HTTPException(status_code=400, detail="Wizytę można odwołać najpóźniej na 24 godziny przed jej rozpoczęciem")
+        raise HTTPException(status_code=400, detail="Można odwołać tylko zarezerwowaną wizytę")
+
+    await record_transition(appt["doctor_id"], appt["start_time"], "booked", "available")
+    invalidate("appointments")
 
     return {"message": "Wizyta została pomyślnie odwołana"}
 
 @router.patch("/book/{appointment_id}", response_model=AppointmentOut)
-async def book_visit(appointment_id: str, details: AppointmentDetails, current_user: dict = Depends(get_current_user)): 
+async def book_visit(appointment_id: str, details: AppointmentDetails, current_user: dict = Depends(get_current_principal)): 
     if current_user.get("role") != "patient":
         raise HTTPException(status_code=403, detail="Tylko pacjent może rezerwować wizyty")
     
-    update_data = {
-        "patient_id": ObjectId(current_user["_id"]),
-        "status": "booked",
-        "details": details.model_dump()
-    }
-
-    updated = await appointment_collection.find_one_and_update(
-        {"_id": ObjectId(appointment_id), "status": "available"},
-        {"$set": update_data},
-        return_document=True
+    updated = await appointment_crud.book(
+        object_id(appointment_id, "Niepoprawny format ID wizyty"),
+        object_id(current_user["_id"]),
+        details.model_dump(),
+        datetime.utcnow()
     )
 
     if not updated:
         raise HTTPException(status_code=400, detail="Wizyta już zajęta lub nie istnieje")
+    await record_transition(updated["doctor_id"], updated["start_time"], "available", "booked")
+    invalidate("appointments")
     return updated
 
 @router.get("/my-medical-history", response_model=List[MedicalHistoryOut])
-async def get_my_full_medical_history(current_user: dict = Depends(get_current_user)):
+async def get_my_full_medical_history(current_user: dict = Depends(get_current_principal)):
     if current_user.get("role") != "patient":
         raise HTTPException(status_code=403, detail="Tylko pacjent może rezerwować wizyty")
     
-    history = await medical_history_collection.find(
-        {"patient_id": str(current_user.get("_id"))}
-    ).sort("date", -1).to_list(100)
-
-    return [clean_mongo_doc(doc) for doc in history]
+    history = await history_crud.list_for_patient(object_id(current_user.get("_id")))
 
+    return MongoJSONResponse(history)
@@ -0,0 +1,88 @@
+from datetime import date, datetime, time, timedelta
+from typing import Hashable, Iterable, List, Tuple
+
+Interval = Tuple[datetime, datetime]
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def generate_slots(start: datetime, end: datetime, interval_minutes: int, blocked: Iterable[Interval]) -> List[Interval]:
+    # Przejście (sweep) po posortowanych, scalonych blokadach - O(sloty + blokady)
+    step = timedelta(minutes=interval_minutes)
+    blocked = merge_intervals(blocked)
+    slots: List[Interval] = []
+    i = 0
+    slot_start = start
+
+    while slot_start + step <= end:
+        slot_end = slot_start + step
+        while i < len(blocked) and blocked[i][1] <= slot_start:
+            i += 1
+
+        if i < len(blocked) and blocked[i][0] < slot_end:
+            # Kolizja - przeskakujemy siatkę do końca blokady
+            skip = blocked[i][1] - slot_start
+            slot_start += step * max(1, -(-skip // step))
+            continue
+
+        slots.append((slot_start, slot_end))
+        slot_start = slot_end
+
+    return slots
+
+def find_overlaps(intervals: Iterable[Tuple[datetime, datetime, Hashable]]) -> List[Tuple[Hashable, Hashable]]:
+    # Sweep po posortowanych początkach z listą aktywnych przedziałów
+    overlaps = []
+    active: List[Tuple[datetime, Hashable]] = []
+    for start, end, key in sorted(intervals, key=lambda item: (item[0], item[1])):
+        active = [(a_end, a_key) for a_end, a_key in active if a_end > start]
+        overlaps.extend((a_key, key) for _, a_key in active)
+        active.append((end, key))
+    return overlaps
+
+def working_days(date_from: date, date_to: date, weekdays: Iterable[int]) -> List[date]:
+    allowed = set(weekdays)
+    days = []
+    day = date_from
+    while day <= date_to:
+        if day.weekday() in allowed:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+def generate_pattern_slots(
+    days: Iterable[date],
+    day_start: time,
+    day_end: time,
+    interval_minutes: int,
+    daily_breaks: Iterable[Tuple[time, time]],
+    existing: Iterable[Interval],
+) -> List[Interval]:
+    daily_breaks = list(daily_breaks)
+    blocked = list(existing)
+    windows = []
+    for day in days:
+        windows.append((datetime.combine(day, day_start), datetime.combine(day, day_end)))
+        blocked.extend(
+            (datetime.combine(day, b_start), datetime.combine(day, b_end))
+            for b_start, b_end in daily_breaks
+        )
+
+    blocked = merge_intervals(blocked)
+    slots: List[Interval] = []
+    i = 0
+    for window_start, window_end in sorted(windows):
+        while i < len(blocked) and blocked[i][1] <= window_start:
+            i += 1
+        j = i
+        while j < len(blocked) and blocked[j][0] < window_end:
+            j += 1
+        slots.extend(generate_slots(window_start, window_end, interval_minutes, blocked[i:j]))
+    return slots
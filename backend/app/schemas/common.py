@@ -1,10 +1,11 @@
 from pydantic import BaseModel
-from typing import List, Generic, TypeVar
+from typing import List, Generic, Optional, TypeVar
 
 T = TypeVar("T")
 
 class PaginationResponse(BaseModel, Generic[T]):
     items: List[T]
-    total: int
-    page: int
-    size: int
\ No newline at end of file
+    total: Optional[int] = None
+    page: Optional[int] = None
+    size: int
+    next_cursor: Optional[str] = None
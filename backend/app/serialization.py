@@ -0,0 +1,54 @@
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+import orjson
+from bson import Decimal128, ObjectId
+from fastapi.responses import JSONResponse
+
+def encode_bson(content: Any) -> Any:
+    # Iteracyjne przejście (bez rekurencji) po kopii dokumentu: ObjectId -> str, "_id" -> "id"
+    if isinstance(content, ObjectId):
+        return str(content)
+    if isinstance(content, dict):
+        root = dict(content)
+    elif isinstance(content, (list, tuple)):
+        root = list(content)
+    else:
+        return content
+
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for key, value in (node.items() if isinstance(node, dict) else enumerate(node)):
+            if isinstance(value, ObjectId):
+                node[key] = str(value)
+            elif isinstance(value, dict):
+                node[key] = value = dict(value)
+                stack.append(value)
+            elif isinstance(value, (list, tuple)):
+                node[key] = value = list(value)
+                stack.append(value)
+        if isinstance(node, dict) and "_id" in node:
+            node["id"] = node["_id"]
+    return root
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (ObjectId, Decimal128, Decimal, UUID)):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "model_dump"):
+        return encode_bson(value.model_dump())
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(encode_bson(content), default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+class MongoJSONResponse(JSONResponse):
+    """Odpowiedź serializująca dokumenty Mongo bez ponownej walidacji przez response_model."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,282 @@
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+from .availability import day_key
+from .database import TRANSACTIONS_UNSUPPORTED, appointment_bucket_collection, appointment_bucket_read_collection, get_client
+
+# SLOT_STORAGE=buckets: jeden dokument na lekarza i dzień z osadzoną tablicą slotów
+# {_id, doctor_id, date, updated_at, slots: [{_id, start_time, end_time, status, patient_id, details, ...}]}
+BUCKETED = os.getenv("SLOT_STORAGE", "documents") == "buckets"
+# Listy stronicowane czytają kubełki oknami po tyle dni - bez sortowania całej kolekcji
+PAGE_WINDOW_DAYS = int(os.getenv("SLOT_BUCKET_PAGE_DAYS", 7))
+
+_SLOT_FIELDS = ("_id", "start_time", "end_time", "status", "patient_id", "details", "booked_at", "cancellations")
+# Wizyta trwa krócej niż dobę - warunek na end_time zawęża kubełki najwyżej o dzień wstecz
+_MAX_SLOT_LENGTH = timedelta(days=1)
+
+# Etapy zamieniające kubełki na płaskie sloty w formacie kolekcji appointments
+FLATTEN = [
+    {"$unwind": "$slots"},
+    {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$slots", {"doctor_id": "$doctor_id"}]}}},
+]
+
+def _flatten(bucket: dict, slot: dict) -> dict:
+    return {**slot, "doctor_id": bucket["doctor_id"]}
+
+def _split(expected: Optional[dict]) -> Tuple[dict, dict]:
+    # doctor_id jest polem kubełka, pozostałe warunki dotyczą slotu
+    expected = dict(expected or {})
+    bucket_filter = {"doctor_id": expected.pop("doctor_id")} if "doctor_id" in expected else {}
+    return bucket_filter, expected
+
+async def insert_slots(slots: Iterable[dict], session=None) -> int:
+    by_day = defaultdict(list)
+    for slot in slots:
+        embedded = {key: slot[key] for key in _SLOT_FIELDS if key in slot}
+        embedded.setdefault("_id", ObjectId())
+        by_day[(slot["doctor_id"], day_key(slot["start_time"]))].append(embedded)
+    if not by_day:
+        return 0
+
+    now = datetime.utcnow()
+    await appointment_bucket_collection.bulk_write([
+        UpdateOne(
+            {"doctor_id": doctor_id, "date": day},
+            {
+                "$push": {"slots": {"$each": day_slots, "$sort": {"start_time": 1}}},
+                "$set": {"updated_at": now},
+            },
+            upsert=True
+        )
+        for (doctor_id, day), day_slots in by_day.items()
+    ], ordered=False, session=session)
+    return sum(len(day_slots) for day_slots in by_day.values())
+
+async def find_slot(slot_id: ObjectId) -> Optional[dict]:
+    bucket = await appointment_bucket_collection.find_one(
+        {"slots._id": slot_id},
+        {"doctor_id": 1, "slots": {"$elemMatch": {"_id": slot_id}}}
+    )
+    if not bucket or not bucket.get("slots"):
+        return None
+    return _flatten(bucket, bucket["slots"][0])
+
+async def _update_slot(
+    slot_filter: dict,
+    changes: dict,
+    now: datetime,
+    increments: Optional[dict] = None,
+    bucket_filter: Optional[dict] = None,
+    session=None,
+) -> Optional[dict]:
+    # Filtr dokumentu i arrayFilters zawierają te same warunki - zmiana jest atomowa w obrębie kubełka
+    slot_id = slot_filter["_id"]
+    update = {"$set": {**{f"slots.$[slot].{key}": value for key, value in changes.items()}, "updated_at": now}}
+    if increments:
+        update["$inc"] = {f"slots.$[slot].{key}": value for key, value in increments.items()}
+
+    bucket = await appointment_bucket_collection.find_one_and_update(
+        {**(bucket_filter or {}), "slots": {"$elemMatch": slot_filter}},
+        update,
+        array_filters=[{f"slot.{key}": value for key, value in slot_filter.items()}],
+        projection={"doctor_id": 1, "slots": {"$elemMatch": {"_id": slot_id}}},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    if not bucket or not bucket.get("slots"):
+        return None
+    return _flatten(bucket, bucket["slots"][0])
+
+async def _pull_slot(slot_id: ObjectId, now: datetime, expected: Optional[dict] = None, session=None) -> Optional[dict]:
+    bucket_filter, slot_filter = _split(expected)
+    bucket = await appointment_bucket_collection.find_one_and_update(
+        {**bucket_filter, "slots": {"$elemMatch": {"_id": slot_id, **slot_filter}}},
+        {"$pull": {"slots": {"_id": slot_id}}, "$set": {"updated_at": now}},
+        projection={"doctor_id": 1, "slots": {"$elemMatch": {"_id": slot_id}}},
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    if not bucket or not bucket.get("slots"):
+        return None
+    return _flatten(bucket, bucket["slots"][0])
+
+async def book_slot(slot_id: ObjectId, patient_id: ObjectId, details: dict, now: datetime) -> Optional[dict]:
+    return await _update_slot(
+        {"_id": slot_id, "status": "available"},
+        {"status": "booked", "patient_id": patient_id, "details": details, "booked_at": now},
+        now
+    )
+
+async def cancel_slot(slot_id: ObjectId, patient_id: ObjectId, not_before: datetime, now: datetime) -> Optional[dict]:
+    return await _update_slot(
+        {"_id": slot_id, "patient_id": patient_id, "status": "booked", "start_time": {"$gte": not_before}},
+        {"status": "available", "patient_id": None, "details": None, "booked_at": None},
+        now,
+        {"cancellations": 1}
+    )
+
+async def complete_slot(slot_id: ObjectId, doctor_id: ObjectId, patient_id: ObjectId, now: datetime, session=None) -> Optional[dict]:
+    return await _update_slot(
+        {"_id": slot_id, "patient_id": patient_id, "status": "booked"},
+        {"status": "completed"},
+        now,
+        bucket_filter={"doctor_id": doctor_id},
+        session=session
+    )
+
+async def update_slot(slot_id: ObjectId, changes: dict, now: datetime, expected: Optional[dict] = None) -> Optional[dict]:
+    current = await find_slot(slot_id)
+    if current is None:
+        return None
+    changes = {key: value for key, value in changes.items() if key != "updated_at"}
+    bucket_filter, slot_filter = _split(expected)
+    target = (changes.get("doctor_id", current["doctor_id"]), day_key(changes.get("start_time", current["start_time"])))
+
+    if target == (current["doctor_id"], day_key(current["start_time"])):
+        slot_changes = {key: value for key, value in changes.items() if key != "doctor_id"}
+        return await _update_slot(
+            {"_id": slot_id, **slot_filter}, slot_changes, now,
+            # Oczekiwany lekarz wywołującego ma pierwszeństwo - to on pilnuje równoległych zmian
+            bucket_filter={"doctor_id": current["doctor_id"], **bucket_filter}
+        )
+
+    # Zmiana lekarza lub dnia przenosi slot do innego kubełka - usunięcie i wstawienie w jednej transakcji
+    async def move(session) -> Optional[dict]:
+        removed = await _pull_slot(slot_id, now, expected, session)
+        if removed is None:
+            return None
+        moved = {**removed, **changes}
+        await insert_slots([moved], session=session)
+        return moved
+
+    try:
+        async with await get_client().start_session() as session:
+            return await session.with_transaction(move)
+    except OperationFailure as exc:
+        if exc.code != TRANSACTIONS_UNSUPPORTED:
+            raise
+        raise HTTPException(
+            status_code=503,
+            detail="Przeniesienie slotu do innego dnia lub lekarza wymaga MongoDB działającej jako replica set (transakcje)"
+        )
+
+async def delete_slot(slot_id: ObjectId, now: datetime, expected: Optional[dict] = None) -> Optional[dict]:
+    return await _pull_slot(slot_id, now, expected)
+
+async def write_batch(items: List[Tuple[dict, Optional[dict]]], now: datetime) -> Tuple[List[bool], Optional[Tuple[int, str]]]:
+    # Kubełki nie mają odpowiednika bulk_write na pojedynczych slotach - zapisy idą po kolei
+    applied = []
+    for i, (before, changes) in enumerate(items):
+        expected = {field: before.get(field) for field in ("doctor_id", "start_time", "end_time", "status")}
+        try:
+            if changes is None:
+                result = await delete_slot(before["_id"], now, expected)
+            else:
+                result = await update_slot(before["_id"], changes, now, expected)
+        except PyMongoError as exc:
+            return applied + [False] * (len(items) - i), (i, str(exc))
+        except HTTPException as exc:
+            return applied + [False] * (len(items) - i), (i, exc.detail)
+        applied.append(result is not None)
+    return applied, None
+
+def _is_plain(condition) -> bool:
+    # Tylko równość i $in dają się przenieść na poziom kubełka ($ne odrzuciłby cały kubełek)
+    return not isinstance(condition, dict) or set(condition) <= {"$in"}
+
+def _bucket_match(query: dict, page_filter: Optional[dict] = None, direction: int = 1) -> dict:
+    # query w formacie płaskich wizyt (doctor_id, status, start_time) - jak dla kolekcji appointments
+    match = {}
+    if "doctor_id" in query:
+        match["doctor_id"] = query["doctor_id"]
+    for field in ("_id", "patient_id", "status"):
+        if field in query and _is_plain(query[field]):
+            match[f"slots.{field}"] = query[field]
+
+    lower, upper = [], []
+    time_range = query.get("start_time") if isinstance(query.get("start_time"), dict) else {}
+    for op in ("$gte", "$gt"):
+        if op in time_range:
+            lower.append(day_key(time_range[op]))
+    if "$lt" in time_range:
+        upper.append(("$lt", time_range["$lt"]))
+    if "$lte" in time_range:
+        upper.append(("$lte", time_range["$lte"]))
+    end_range = query.get("end_time") if isinstance(query.get("end_time"), dict) else {}
+    for op in ("$gte", "$gt"):
+        if op in end_range:
+            lower.append(day_key(end_range[op] - _MAX_SLOT_LENGTH))
+    if page_filter and "$or" in page_filter:
+        # Kursor keyset: pierwszy warunek to {"start_time": {"$gt"/"$lt": wartość}}
+        (op, value), = page_filter["$or"][0]["start_time"].items()
+        if direction == 1:
+            lower.append(day_key(value))
+        else:
+            upper.append(("$lte", value))
+
+    date = {}
+    if lower:
+        date["$gte"] = max(lower)
+    for op, value in upper:
+        if op not in date or value < date[op]:
+            date[op] = value
+    if date:
+        match["date"] = date
+    return match
+
+async def _aggregate(match: dict, query: dict, page_filter: Optional[dict], limit: Optional[int], direction: int) -> List[dict]:
+    pipeline = [{"$match": match}, *FLATTEN, {"$match": query}]
+    if page_filter:
+        pipeline.append({"$match": page_filter})
+    pipeline.append({"$sort": {"start_time": direction, "_id": direction}})
+    if limit is not None:
+        pipeline.append({"$limit": limit})
+    return await appointment_bucket_read_collection.aggregate(pipeline).to_list(limit)
+
+async def find_slots(query: dict, page_filter: Optional[dict] = None, limit: Optional[int] = None, direction: int = 1) -> List[dict]:
+    match = _bucket_match(query, page_filter, direction)
+    if limit is None or direction != 1:
+        return await _aggregate(match, query, page_filter, limit, direction)
+
+    # Strona w kolejności czasu: kolejne okna dni, dopóki nie zbierzemy limitu
+    items = []
+    date_range = match.get("date", {})
+    start = date_range.get("$gte")
+    while len(items) < limit:
+        lookup = {**match, "date": {**date_range, "$gte": start}} if start is not None else match
+        first = await appointment_bucket_read_collection.find_one(lookup, {"date": 1}, sort=[("date", 1)])
+        if first is None:
+            break
+        window = {**date_range, "$gte": first["date"], "$lt": first["date"] + timedelta(days=PAGE_WINDOW_DAYS)}
+        if "$lt" in date_range:
+            window["$lt"] = min(window["$lt"], date_range["$lt"])
+        items += await _aggregate({**match, "date": window}, query, page_filter, limit - len(items), 1)
+        start = window["$lt"]
+    return items
+
+async def count_slots(query: dict) -> int:
+    pipeline = [{"$match": _bucket_match(query)}, *FLATTEN, {"$match": query}, {"$count": "total"}]
+    result = await appointment_bucket_read_collection.aggregate(pipeline).to_list(1)
+    return result[0]["total"] if result else 0
+
+def export_cursor(query: dict, projection: dict, batch_size: int):
+    return appointment_bucket_read_collection.aggregate(
+        [{"$match": _bucket_match(query)}, *FLATTEN, {"$match": query}, {"$sort": {"start_time": 1}}, {"$project": projection}],
+        allowDiskUse=True,
+        batchSize=batch_size
+    )
+
+async def count_free_by_doctor(doctor_ids: List[ObjectId], after: datetime) -> dict:
+    query = {"doctor_id": {"$in": doctor_ids}, "status": "available", "start_time": {"$gt": after}}
+    rows = appointment_bucket_read_collection.aggregate([
+        {"$match": _bucket_match(query)},
+        *FLATTEN,
+        {"$match": query},
+        {"$group": {"_id": "$doctor_id", "free_slots": {"$sum": 1}}},
+    ])
+    return {row["_id"]: row["free_slots"] async for row in rows}
@@ -0,0 +1,21 @@
+import os
+from . import response_cache
+from .auth.deps import reset_caches
+from .auth.security import reset_hashing_executor
+from .database import reset_client_after_fork
+from .live import reset_broadcaster
+from .middleware.metrics import metrics
+from .rate_limit import reset_rate_limits
+
+def reset_process_state() -> None:
+    """Tworzy od nowa wszystkie singletony procesu - wywoływane w workerze po fork()."""
+    reset_client_after_fork()
+    reset_caches()
+    response_cache.reset()
+    reset_hashing_executor()
+    reset_broadcaster()
+    metrics.reset()
+    reset_rate_limits()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_process_state)
@@ -0,0 +1,78 @@
+"""Opóźnienie niezwiązanych endpointów podczas fali logowań.
+
+Porównuje synchroniczne wywołanie bcrypt w pętli zdarzeń z wersją
+wykonywaną w puli (``verify_password_async``). Uruchomienie z katalogu backend:
+
+    python -m benchmarks.bench_hashing --logins 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.auth import security
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def unrelated_endpoint_probe(stop: asyncio.Event, interval: float, samples: list):
+    # Lekki endpoint wywoływany co `interval` - mierzymy, o ile później dostaje pętlę zdarzeń
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        scheduled = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append((loop.time() - scheduled) * 1000)
+
+
+async def login_burst(mode: str, hashed: str, logins: int, concurrency: int):
+    limiter = asyncio.Semaphore(concurrency)
+
+    async def one_login():
+        async with limiter:
+            if mode == "sync":
+                security.verify_password("haslo12345", hashed)
+            else:
+                await security.verify_password_async("haslo12345", hashed)
+
+    await asyncio.gather(*(one_login() for _ in range(logins)))
+
+
+async def run(mode: str, logins: int, concurrency: int, interval: float):
+    hashed = security.hash_password("haslo12345")
+    samples: list = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(unrelated_endpoint_probe(stop, interval, samples))
+
+    started = time.perf_counter()
+    await login_burst(mode, hashed, logins, concurrency)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe
+    security.shutdown_hashing_executor()
+
+    print(
+        f"{mode:>5}: {logins} logowań w {elapsed:.2f}s | "
+        f"sondy={len(samples)} p50={statistics.median(samples):.2f}ms "
+        f"p99={percentile(samples, 0.99):.2f}ms max={max(samples):.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--interval-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"bcrypt rounds={security.BCRYPT_ROUNDS} executor={security.HASH_EXECUTOR} workers={security.HASH_WORKERS}")
+    for mode in ("sync", "async"):
+        asyncio.run(run(mode, args.logins, args.concurrency, args.interval_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
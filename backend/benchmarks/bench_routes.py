@@ -0,0 +1,298 @@
+"""Benchmark wszystkich endpointów z app/routes z porównaniem do zapisanej linii bazowej.
+
+Na osobnej bazie zasiewa dane (benchmarks.seed), uruchamia aplikację razem z
+lifespan i przez ASGITransport wywołuje każdą trasę. Dla każdej zapisuje
+czas odpowiedzi (p50/p95), średnią liczbę komend MongoDB na żądanie (z
+MetricsMiddleware) i szczyt zaalokowanej pamięci (tracemalloc). Wymaga
+działającej bazy MongoDB z replica setem (transakcje, MONGO_DETAILS):
+
+    python -m benchmarks.bench_routes --update-baseline
+    python -m benchmarks.bench_routes --repeat 30 --threshold 0.25
+
+Bez --update-baseline wynik porównywany jest z plikiem linii bazowej. Kod 1
+oznacza regresję którejś trasy, błąd 5xx albo zmianę statusu odpowiedzi.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+os.environ.setdefault("MONGO_DB_NAME", "medical_app_bench_routes")
+os.environ.setdefault("SECRET_KEY", "temporary_dev_secret_key_123")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ANALYTICS_REFRESH_SECONDS", "0")
+os.environ.setdefault("ARCHIVE_INTERVAL_SECONDS", "0")
+# Ten sam koszt co hashe z seed() - inaczej każde logowanie przeliczałoby hash od nowa
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# Seria żądań z jednego adresu wyczerpałaby limity logowania i rejestracji
+for limit in ("LOGIN_IP_BURST", "LOGIN_ACCOUNT_BURST", "REGISTER_IP_BURST"):
+    os.environ.setdefault(limit, "0")
+
+import httpx  # noqa: E402
+
+from app.database import appointment_collection, get_client, get_database, init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.middleware.metrics import metrics  # noqa: E402
+from benchmarks.seed import seed, token_for  # noqa: E402
+
+BASELINE = Path(__file__).with_name("baseline_routes.json")
+DETAILS = {"reason_for_visit": "Kontrola okresowa", "previous_treatment": False}
+# Strumień SSE nie kończy się sam - nie da się zmierzyć jak zwykłego żądania
+SKIPPED = {"GET /appointment/live": "strumień SSE"}
+
+
+def route_cases(data: dict, pools: dict) -> list:
+    """Lista (trasa, fabryka żądania). Fabryka dostaje numer iteracji i zwraca (metoda, url, token, kwargs)."""
+    admin = token_for(data["admin"])
+    doctor, other_doctor, spare_doctor = data["doctors"][0], data["doctors"][1], data["doctors"][-1]
+    patient, other_patient = data["patients"][0], data["patients"][1]
+    doctor_token, patient_token = token_for(doctor), token_for(patient)
+    booked = next(s for s in data["slots"] if s["status"] == "booked")
+    booked_doctor = token_for({"_id": booked["doctor_id"], "role": "doctor"})
+    history_patient = next((h["patient_id"] for h in data["histories"] if h["doctor_id"] == doctor["_id"]), patient["_id"])
+    today = datetime.utcnow().date()
+    far = datetime.utcnow().replace(hour=8, minute=0, second=0, microsecond=0) + timedelta(days=400)
+
+    def get(url, token=None):
+        return lambda i: ("GET", url, token, {})
+
+    def completion(i):
+        slot = pools["completing"][i]
+        body = {"patient_id": str(slot["patient_id"]), "appointment_id": str(slot["_id"]),
+                "diagnosis": "Przeziębienie", "recommendations": ["Odpoczynek"], "treatment_notes": "Bez powikłań"}
+        return "POST", "/doctor/add-history", token_for({"_id": slot["doctor_id"], "role": "doctor"}), {"json": body}
+
+    def new_user(prefix, i):
+        return {"email": f"{prefix}{i}@example.com", "password": "haslo12345", "full_name": f"Bench {prefix} {i}"}
+
+    return [
+        ("GET /health/live", get("/health/live")),
+        ("GET /health/ready", get("/health/ready")),
+        ("GET /appointment/available", get("/appointment/available?size=50")),
+        ("GET /appointment/available?doctor_id", get(f"/appointment/available?doctor_id={doctor['_id']}&include_total=true")),
+        ("GET /appointment/earliest", get("/appointment/earliest?limit=10")),
+        ("GET /appointment/availability-summary", get(f"/appointment/availability-summary?year={today.year}&month={today.month}")),
+        ("GET /user/doctors", get("/user/doctors")),
+        ("GET /user/doctors/search", get("/user/doctors/search?q=doc&with_free_slots=true")),
+        ("GET /user/my-appointments", get("/user/my-appointments?include_history=true", patient_token)),
+        ("GET /user/my-medical-history", get("/user/my-medical-history", patient_token)),
+        ("GET /doctor/my-schedule", get("/doctor/my-schedule", doctor_token)),
+        ("GET /doctor/my-schedule/export", get("/doctor/my-schedule/export?format=csv", doctor_token)),
+        ("GET /doctor/history-search", get("/doctor/history-search?q=przeziebienie", doctor_token)),
+        ("GET /doctor/patient-history/{patient_id}", get(f"/doctor/patient-history/{history_patient}", doctor_token)),
+        ("GET /doctor/patient-history/{patient_id}/export",
+         get(f"/doctor/patient-history/{history_patient}/export", doctor_token)),
+        ("GET /doctor/appointment-detail/{appointment_id}", get(f"/doctor/appointment-detail/{booked['_id']}", booked_doctor)),
+        ("GET /admin/all-doctors-full", get("/admin/all-doctors-full", admin)),
+        ("GET /admin/doctors/search", get("/admin/doctors/search?q=doc", admin)),
+        ("GET /admin/doctor/{doctor_id}", get(f"/admin/doctor/{doctor['_id']}", admin)),
+        ("GET /admin/doctor/{doctor_id}/appointments", get(f"/admin/doctor/{doctor['_id']}/appointments", admin)),
+        ("GET /admin/doctor/{doctor_id}/appointments/export", get(f"/admin/doctor/{doctor['_id']}/appointments/export", admin)),
+        ("GET /admin/analytics/utilization", get(
+            f"/admin/analytics/utilization?date_from={today - timedelta(days=30)}&date_to={today}&granularity=week", admin)),
+        ("GET /admin/analytics/doctors", get(f"/admin/analytics/doctors?date_from={today - timedelta(days=30)}&date_to={today}", admin)),
+
+        ("POST /auth/login", lambda i: ("POST", "/auth/login", None,
+                                        {"data": {"username": patient["email"], "password": "haslo12345"}})),
+        ("POST /auth/register", lambda i: ("POST", "/auth/register", None, {"json": new_user("bench-patient", i)})),
+        ("POST /auth/setup-admin-secret", lambda i: ("POST", "/auth/setup-admin-secret", None, {"json": {
+            "user_data": new_user("bench-admin", i), "x_admin_key": os.getenv("ADMIN_KEY", "moje-tajne-haslo-123")}})),
+        ("PATCH /user/book/{appointment_id}", lambda i: (
+            "PATCH", f"/user/book/{pools['booking'][i]['_id']}", patient_token, {"json": DETAILS})),
+        ("PATCH /user/cancel-appointment/{appointment_id}", lambda i: (
+            "PATCH", f"/user/cancel-appointment/{pools['booking'][i]['_id']}", patient_token, {})),
+        ("POST /doctor/add-history", completion),
+        ("POST /admin/generate-bulk-schedule", lambda i: ("POST", "/admin/generate-bulk-schedule", admin, {"json": {
+            "doctor_id": str(doctor["_id"]), "start_time": (far + timedelta(days=i)).isoformat(),
+            "end_time": (far + timedelta(days=i, hours=4)).isoformat(), "interval_minutes": 15}})),
+        ("POST /admin/generate-batch-schedule", lambda i: ("POST", "/admin/generate-batch-schedule", admin, {"json": {
+            "doctor_ids": [str(other_doctor["_id"])], "date_from": str((far + timedelta(days=i)).date()),
+            "date_to": str((far + timedelta(days=i)).date()), "weekdays": list(range(7)),
+            "day_start": "08:00", "day_end": "12:00", "interval_minutes": 15}})),
+        ("PATCH /admin/appointment/{appointment_id}", lambda i: (
+            "PATCH", f"/admin/appointment/{pools['moving'][i]['_id']}", admin, {"json": {
+                "start_time": (far + timedelta(days=200, minutes=15 * i)).isoformat(),
+                "end_time": (far + timedelta(days=200, minutes=15 * (i + 1))).isoformat()}})),
+        ("POST /admin/appointments/batch", lambda i: ("POST", "/admin/appointments/batch", admin, {"json": {"items": [
+            {"appointment_id": str(slot["_id"]), "status": "available"} for slot in pools["batch"][i]
+        ]}})),
+        ("DELETE /admin/appointment/{appointment_id}", lambda i: (
+            "DELETE", f"/admin/appointment/{pools['deleting'][i]['_id']}", admin, {})),
+        ("POST /admin/register-doctor", lambda i: ("POST", "/admin/register-doctor", admin, {"json": new_user("bench-doctor", i)})),
+        ("POST /admin/admin-reset-password", lambda i: ("POST", "/admin/admin-reset-password", admin, {"json": {
+            "user_id": str(other_patient["_id"]), "new_password": "haslo12345"}})),
+        ("PATCH /admin/doctor/{doctor_id}/toggle-activity", lambda i: (
+            "PATCH", f"/admin/doctor/{spare_doctor['_id']}/toggle-activity", admin, {})),
+        ("PUT /admin/doctor/{doctor_id}", lambda i: ("PUT", f"/admin/doctor/{spare_doctor['_id']}", admin, {"json": {
+            "full_name": f"Doctor {i}", "email": spare_doctor["email"]}})),
+        ("POST /admin/analytics/refresh", lambda i: ("POST", "/admin/analytics/refresh", admin, {})),
+        ("POST /admin/maintenance/archive", lambda i: ("POST", "/admin/maintenance/archive", admin, {})),
+    ]
+
+
+async def prepare_pools(data: dict, calls: int) -> dict:
+    # Trasy zmieniające stan dostają w każdej iteracji inny, przyszły slot
+    horizon = datetime.utcnow() + timedelta(days=2)
+    free = sorted((s for s in data["slots"] if s["status"] == "available" and s["start_time"] > horizon),
+                  key=lambda s: s["start_time"])
+    sizes = {"booking": 1, "completing": 1, "moving": 1, "batch": 5, "deleting": 1}
+    needed = calls * sum(sizes.values())
+    if len(free) < needed:
+        raise SystemExit(f"Za mało wolnych slotów w przyszłości ({len(free)} < {needed}) - zwiększ --slots-per-doctor")
+
+    pools, offset = {}, 0
+    for name, size in sizes.items():
+        chunk = free[offset:offset + calls * size]
+        pools[name] = chunk if size == 1 else [chunk[i:i + size] for i in range(0, len(chunk), size)]
+        offset += calls * size
+
+    # Kończyć można tylko zarezerwowane wizyty - rezerwujemy je poza pomiarem
+    patient_id = data["patients"][-1]["_id"]
+    await appointment_collection.update_many(
+        {"_id": {"$in": [slot["_id"] for slot in pools["completing"]]}},
+        {"$set": {"status": "booked", "patient_id": patient_id, "details": DETAILS, "booked_at": datetime.utcnow()}}
+    )
+    for slot in pools["completing"]:
+        slot.update(status="booked", patient_id=patient_id)
+    return pools
+
+
+async def measure(http, factory, warmup: int, repeat: int, trace_memory: bool) -> dict:
+    timings, peaks, statuses = [], [], []
+    for i in range(warmup + repeat):
+        method, url, token, kwargs = factory(i)
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        if i == warmup:
+            metrics.reset()
+        if trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        response = await http.request(method, url, headers=headers, **kwargs)
+        elapsed = (time.perf_counter() - started) * 1000
+        if i < warmup:
+            continue
+        timings.append(elapsed)
+        statuses.append(response.status_code)
+        if trace_memory:
+            peaks.append((tracemalloc.get_traced_memory()[1] - base) / 1024)
+
+    # Jedna trasa na pomiar - histogram MetricsMiddleware zawiera tylko jej żądania
+    histograms = list(metrics.commands_per_request().values())
+    commands = sum(total for total, _ in histograms) / max(1, sum(count for _, count in histograms))
+    return {
+        "status": max(set(statuses), key=statuses.count),
+        "errors": sum(1 for code in statuses if code >= 500),
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0], 3),
+        "mongo_commands": round(commands, 2),
+        "peak_kib": round(statistics.median(peaks), 1) if peaks else None,
+    }
+
+
+def compare(results: dict, baseline: dict, args) -> list:
+    problems = []
+    for route, current in results.items():
+        if current["errors"]:
+            problems.append(f"{route}: {current['errors']} odpowiedzi 5xx")
+        before = baseline.get(route)
+        if before is None:
+            continue
+        if current["status"] != before["status"]:
+            problems.append(f"{route}: status {before['status']} -> {current['status']}")
+        if current["p50_ms"] > before["p50_ms"] * (1 + args.threshold) and \
+                current["p50_ms"] - before["p50_ms"] > args.min_delta_ms:
+            problems.append(f"{route}: p50 {before['p50_ms']:.2f} -> {current['p50_ms']:.2f} ms")
+        if current["mongo_commands"] > before["mongo_commands"] + args.commands_tolerance:
+            problems.append(f"{route}: komendy MongoDB {before['mongo_commands']} -> {current['mongo_commands']}")
+        if current["peak_kib"] is not None and before.get("peak_kib") is not None and \
+                current["peak_kib"] > before["peak_kib"] * (1 + args.memory_threshold) and \
+                current["peak_kib"] - before["peak_kib"] > args.min_delta_kib:
+            problems.append(f"{route}: pamięć {before['peak_kib']:.1f} -> {current['peak_kib']:.1f} KiB")
+    for route in baseline.keys() - results.keys():
+        problems.append(f"{route}: brak w bieżącym pomiarze")
+    return problems
+
+
+async def main(args) -> int:
+    if args.doctors < 3:
+        raise SystemExit("Potrzeba co najmniej 3 lekarzy (jeden jest dezaktywowany w trakcie pomiaru)")
+    # Wyniki zależą też od rollupów, archiwum i podsumowań - zaczynamy od pustej bazy
+    if "bench" not in get_database().name:
+        raise SystemExit(f"Odmowa usunięcia bazy {get_database().name} - MONGO_DB_NAME musi zawierać 'bench'")
+    await get_client().drop_database(get_database().name)
+    await init_db()
+    data = await seed(doctors=args.doctors, patients=args.patients, slots_per_doctor=args.slots_per_doctor,
+                      histories_per_patient=args.histories_per_patient)
+    calls = args.warmup + args.repeat
+    pools = await prepare_pools(data, calls)
+    params = {key: getattr(args, key) for key in ("doctors", "patients", "slots_per_doctor", "histories_per_patient",
+                                                   "warmup", "repeat")}
+
+    cases = route_cases(data, pools)
+    if args.only:
+        cases = [(route, factory) for route, factory in cases if args.only in route]
+    for route, reason in SKIPPED.items():
+        print(f"{route:<55} pominięto ({reason})")
+
+    if not args.no_memory:
+        tracemalloc.start()
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as http:
+            for route, factory in cases:
+                result = await measure(http, factory, args.warmup, args.repeat, not args.no_memory)
+                results[route] = result
+                memory = f"{result['peak_kib']:8.1f} KiB" if result["peak_kib"] is not None else ""
+                print(f"{route:<55} {result['status']} p50 {result['p50_ms']:8.2f} ms, p95 {result['p95_ms']:8.2f} ms, "
+                      f"komendy {result['mongo_commands']:5.1f} {memory}")
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps({"params": params, "routes": results}, indent=2, ensure_ascii=False) + "\n")
+        print(f"Zapisano linię bazową: {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"Brak linii bazowej {baseline_path} - uruchom z --update-baseline")
+        return 1
+
+    baseline = json.loads(baseline_path.read_text())
+    if baseline["params"] != params:
+        print(f"Linia bazowa zmierzona z innymi parametrami: {baseline['params']}")
+        return 1
+    baseline_routes = baseline["routes"]
+    if args.only:
+        baseline_routes = {route: value for route, value in baseline_routes.items() if args.only in route}
+    problems = compare(results, baseline_routes, args)
+    for problem in problems:
+        print(f"REGRESJA: {problem}")
+    print(f"Sprawdzono {len(results)} tras, regresji: {len(problems)}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--doctors", type=int, default=5)
+    parser.add_argument("--patients", type=int, default=20)
+    # seed() zaczyna grafik 30 dni wstecz - 3200 slotów po 15 min sięga ok. 3 dni w przyszłość
+    parser.add_argument("--slots-per-doctor", type=int, default=3200)
+    parser.add_argument("--histories-per-patient", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--only", help="mierz tylko trasy zawierające ten fragment")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="dopuszczalny wzrost p50 (ułamek)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="pomijaj wzrosty p50 mniejsze niż tyle ms")
+    parser.add_argument("--commands-tolerance", type=float, default=0.5)
+    parser.add_argument("--memory-threshold", type=float, default=0.25)
+    parser.add_argument("--min-delta-kib", type=float, default=64.0)
+    parser.add_argument("--no-memory", action="store_true", help="bez tracemalloc (dokładniejsze czasy)")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,71 @@
+"""Generowanie grafiku: dawna pętla z any(...) kontra sweep z app.scheduling.
+
+Symuluje kwartał (domyślnie 100 lekarzy x 90 dni) z przerwą obiadową i już
+istniejącymi wizytami. Nie wymaga bazy danych:
+
+    python -m benchmarks.bench_scheduling --doctors 100 --days 90
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta, time as dtime
+
+from app.scheduling import generate_pattern_slots, working_days
+
+
+def naive_slots(days, day_start, day_end, interval_minutes, daily_breaks, existing):
+    # Odtworzenie poprzedniego algorytmu generate_bulk_schedule (dzień po dniu)
+    slots = []
+    step = timedelta(minutes=interval_minutes)
+    for day in days:
+        breaks = [
+            {"start": datetime.combine(day, s), "end": datetime.combine(day, e)}
+            for s, e in daily_breaks
+        ]
+        current = datetime.combine(day, day_start)
+        end = datetime.combine(day, day_end)
+        while current + step <= end:
+            slot_end = current + step
+            is_during_break = any(current < b["end"] and slot_end > b["start"] for b in breaks)
+            has_collision = any(a_start < slot_end and a_end > current for a_start, a_end in existing)
+            if not is_during_break and not has_collision:
+                slots.append({"start_time": current, "end_time": slot_end, "created_at": datetime.utcnow()})
+            current = slot_end
+    return slots
+
+
+def existing_for(days, per_doctor, rng):
+    existing = []
+    for _ in range(per_doctor):
+        day = rng.choice(days)
+        start = datetime.combine(day, dtime(8)) + timedelta(minutes=15 * rng.randrange(32))
+        existing.append((start, start + timedelta(minutes=rng.choice([15, 30, 45]))))
+    return existing
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--doctors", type=int, default=100)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--existing", type=int, default=300, help="istniejące wizyty na lekarza")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = date(2026, 1, 1)
+    days = working_days(start, start + timedelta(days=args.days - 1), [0, 1, 2, 3, 4])
+    daily_breaks = [(dtime(12), dtime(12, 30))]
+    existing = [existing_for(days, args.existing, rng) for _ in range(args.doctors)]
+
+    for name, func in (("naive", naive_slots), ("sweep", generate_pattern_slots)):
+        started = time.perf_counter()
+        total = sum(
+            len(func(days, dtime(8), dtime(16), 15, daily_breaks, existing[d]))
+            for d in range(args.doctors)
+        )
+        elapsed = time.perf_counter() - started
+        print(f"{name:>5}: {total} slotów w {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
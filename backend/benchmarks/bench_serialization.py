@@ -0,0 +1,75 @@
+"""Serializacja grafiku 1000 wizyt: dawny clean_mongo_doc + jsonable_encoder kontra MongoJSONResponse.
+
+    python -m benchmarks.bench_serialization --docs 1000 --repeat 200
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from app.serialization import dumps
+
+
+def legacy_clean_mongo_doc(doc):
+    # Kopia dawnej funkcji z routes/doctors.py
+    if not doc:
+        return doc
+    new_doc = doc.copy()
+    if "_id" in new_doc:
+        new_doc["id"] = str(new_doc["_id"])
+    for key, value in new_doc.items():
+        if isinstance(value, ObjectId):
+            new_doc[key] = str(value)
+        elif isinstance(value, dict):
+            new_doc[key] = legacy_clean_mongo_doc(value)
+    return new_doc
+
+
+def legacy_render(docs):
+    cleaned = [legacy_clean_mongo_doc(doc) for doc in docs]
+    return json.dumps(jsonable_encoder(cleaned), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def schedule(count: int):
+    doctor_id = ObjectId()
+    start = datetime(2026, 1, 5, 8)
+    return [
+        {
+            "_id": ObjectId(),
+            "doctor_id": doctor_id,
+            "patient_id": ObjectId() if i % 3 else None,
+            "start_time": start + timedelta(minutes=15 * i),
+            "end_time": start + timedelta(minutes=15 * (i + 1)),
+            "status": "booked" if i % 3 else "available",
+            "created_at": start,
+            "details": {"reason_for_visit": "Kontrola okresowa", "previous_treatment": False,
+                        "additional_notes": None} if i % 3 else None,
+        }
+        for i in range(count)
+    ]
+
+
+def measure(func, docs, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = func(docs)
+    return (time.perf_counter() - started) / repeat * 1000, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    docs = schedule(args.docs)
+    for name, func in (("legacy", legacy_render), ("orjson", dumps)):
+        per_call, size = measure(func, docs, args.repeat)
+        print(f"{name:>6}: {per_call:.2f} ms / odpowiedź ({size} B)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Model slotów: dokument na slot (appointments) kontra kubełek lekarz/dzień (appointment_buckets).
+
+Wypełnia obie kolekcje tym samym grafikiem w osobnej bazie, porównuje rozmiar
+danych i indeksów (collStats) oraz czas listowania wolnych terminów lekarza na
+tydzień - tym samym zapytaniem, którego używa /appointment/available. Wymaga
+działającej bazy MongoDB (MONGO_DETAILS):
+
+    python -m benchmarks.bench_slot_storage --doctors 50 --days 60 --repeat 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("MONGO_DB_NAME", "medical_app_bench_slots")
+
+from bson import ObjectId  # noqa: E402
+
+from app import slot_buckets  # noqa: E402
+from app.database import (  # noqa: E402
+    appointment_bucket_collection, appointment_collection, get_database, init_db
+)
+
+
+def build_schedule(doctors: int, days: int, slots_per_day: int, booked_ratio: float, rng: random.Random) -> list:
+    start = datetime(2026, 1, 5, 8)
+    created_at = datetime.utcnow()
+    slots = []
+    for doctor_id in (ObjectId() for _ in range(doctors)):
+        for day in range(days):
+            day_start = start + timedelta(days=day)
+            for i in range(slots_per_day):
+                booked = rng.random() < booked_ratio
+                slot_start = day_start + timedelta(minutes=15 * i)
+                slots.append({
+                    "_id": ObjectId(),
+                    "doctor_id": doctor_id,
+                    "start_time": slot_start,
+                    "end_time": slot_start + timedelta(minutes=15),
+                    "status": "booked" if booked else "available",
+                    "patient_id": ObjectId() if booked else None,
+                    "details": {"reason_for_visit": "Kontrola okresowa", "previous_treatment": False} if booked else None,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                })
+    return slots
+
+
+async def storage(name: str) -> dict:
+    stats = await get_database().command("collStats", name)
+    return {"count": stats["count"], "size": stats["size"], "storage": stats["storageSize"],
+            "indexes": stats["totalIndexSize"]}
+
+
+async def time_listing(list_page, queries: list, repeat: int) -> list:
+    timings = []
+    for i in range(repeat):
+        query = queries[i % len(queries)]
+        started = time.perf_counter()
+        await list_page(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def main(args) -> None:
+    rng = random.Random(args.seed)
+    await appointment_collection.drop()
+    await appointment_bucket_collection.drop()
+    await init_db()
+
+    slots = build_schedule(args.doctors, args.days, args.slots_per_day, args.booked_ratio, rng)
+    for i in range(0, len(slots), 10000):
+        await appointment_collection.insert_many([dict(slot) for slot in slots[i:i + 10000]], ordered=False)
+    await slot_buckets.insert_slots(slots)
+
+    doctor_ids = sorted({slot["doctor_id"] for slot in slots})
+    first_day = min(slot["start_time"] for slot in slots).replace(hour=0, minute=0)
+    queries = []
+    for _ in range(50):
+        week = first_day + timedelta(days=rng.randrange(max(1, args.days - 7)))
+        queries.append({"status": "available", "doctor_id": rng.choice(doctor_ids),
+                        "start_time": {"$gte": week, "$lt": week + timedelta(days=7)}})
+
+    async def list_documents(query):
+        return await appointment_collection.find(query).sort([("start_time", 1), ("_id", 1)]).limit(args.size).to_list(args.size)
+
+    async def list_buckets(query):
+        return await slot_buckets.find_slots(query, limit=args.size)
+
+    print(f"Sloty: {len(slots)} ({args.doctors} lekarzy x {args.days} dni x {args.slots_per_day})")
+    for label, collection, list_page in (
+        ("dokument/slot", appointment_collection, list_documents),
+        ("kubełek/dzień", appointment_bucket_collection, list_buckets),
+    ):
+        await time_listing(list_page, queries, 20)  # rozgrzewka
+        timings = await time_listing(list_page, queries, args.repeat)
+        info = await storage(collection.name)
+        print(
+            f"{label:>14}: dokumentów {info['count']:>8}, dane {info['size'] / 2**20:8.2f} MiB, "
+            f"na dysku {info['storage'] / 2**20:8.2f} MiB, indeksy {info['indexes'] / 2**20:8.2f} MiB, "
+            f"lista p50 {statistics.median(timings):6.2f} ms, p95 {statistics.quantiles(timings, n=20)[-1]:6.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--slots-per-day", type=int, default=32)
+    parser.add_argument("--booked-ratio", type=float, default=0.4)
+    parser.add_argument("--size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+"""Skalowanie przepustowości wraz z liczbą workerów gunicorna.
+
+Dla każdej liczby workerów uruchamia `gunicorn app.main:app -c gunicorn.conf.py`,
+czeka na /health/ready, obciąża wybrany endpoint przez zadany czas i zatrzymuje
+serwer sygnałem SIGTERM (graceful shutdown). Wymaga działającej bazy MongoDB:
+
+    python -m benchmarks.bench_workers --max-workers 4 --path /user/doctors
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+async def wait_ready(base_url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health/ready")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError("Serwer nie zgłosił gotowości")
+
+
+async def load(base_url: str, path: str, concurrency: int, duration: float) -> tuple:
+    done = errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def user():
+            nonlocal done, errors
+            while time.monotonic() < deadline:
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 500:
+                        errors += 1
+                    done += 1
+                except httpx.TransportError:
+                    errors += 1
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    return done, errors
+
+
+def run_server(workers: int, port: int) -> subprocess.Popen:
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "BIND": f"127.0.0.1:{port}", "ACCESS_LOG": ""}
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app.main:app", "-c", "gunicorn.conf.py"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--path", default="/user/doctors")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    baseline = None
+    for workers in range(1, args.max_workers + 1):
+        server = run_server(workers, args.port)
+        try:
+            asyncio.run(wait_ready(base_url))
+            done, errors = asyncio.run(load(base_url, args.path, args.concurrency, args.duration))
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+        throughput = done / args.duration
+        baseline = baseline or throughput
+        print(f"workers={workers}: {throughput:.0f} req/s (x{throughput / baseline:.2f}), błędy={errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Równoległe rezerwacje, odwołania i zakończenia wizyt - sprawdzenie niezmienników.
+
+Wymaga MongoDB z replica setem (transakcje, MONGO_DETAILS). Na osobnej bazie
+zasiewa dane, a następnie przez ASGITransport wysyła jednocześnie:
+  * rezerwacje tego samego slotu przez wielu pacjentów,
+  * odwołania i ponowne rezerwacje tych samych wizyt,
+  * wielokrotne zakończenie tej samej wizyty z wpisem do historii.
+Na końcu weryfikuje stan bazy i kończy się kodem 1 przy naruszeniu:
+
+    python -m benchmarks.check_concurrency --rounds 20 --contenders 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+os.environ.setdefault("MONGO_DB_NAME", "medical_app_concurrency")
+os.environ.setdefault("SECRET_KEY", "temporary_dev_secret_key_123")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ANALYTICS_REFRESH_SECONDS", "0")
+os.environ.setdefault("ARCHIVE_INTERVAL_SECONDS", "0")
+
+import httpx  # noqa: E402
+
+from app.database import appointment_collection, init_db, medical_history_collection  # noqa: E402
+from app.main import app  # noqa: E402
+from benchmarks.seed import seed, token_for  # noqa: E402
+
+DETAILS = {"reason_for_visit": "Kontrola okresowa", "previous_treatment": False}
+
+
+def auth(user: dict) -> dict:
+    return {"Authorization": f"Bearer {token_for(user)}"}
+
+
+async def race_booking(http, slots: list, patients: list, contenders: int) -> list:
+    errors = []
+    for slot in slots:
+        responses = await asyncio.gather(*(
+            http.patch(f"/user/book/{slot['_id']}", json=DETAILS, headers=auth(patient))
+            for patient in patients[:contenders]
+        ))
+        winners = [r for r in responses if r.status_code == 200]
+        if len(winners) != 1:
+            errors.append(f"slot {slot['_id']}: {len(winners)} udanych rezerwacji")
+    return errors
+
+
+async def race_cancel_and_rebook(http, slots: list, patients: list) -> list:
+    # Właściciel odwołuje, a inni pacjenci w tym samym momencie próbują zarezerwować
+    errors = []
+    for slot in slots:
+        doc = await appointment_collection.find_one({"_id": slot["_id"]}, {"patient_id": 1})
+        owner = next(p for p in patients if p["_id"] == doc["patient_id"])
+        others = [p for p in patients if p["_id"] != owner["_id"]][:3]
+        responses = await asyncio.gather(
+            http.patch(f"/user/cancel-appointment/{slot['_id']}", headers=auth(owner)),
+            http.patch(f"/user/cancel-appointment/{slot['_id']}", headers=auth(owner)),
+            *(http.patch(f"/user/book/{slot['_id']}", json=DETAILS, headers=auth(p)) for p in others),
+        )
+        cancels = [r for r in responses[:2] if r.status_code == 200]
+        if len(cancels) != 1:
+            errors.append(f"slot {slot['_id']}: {len(cancels)} udanych odwołań")
+    return errors
+
+
+async def race_completion(http, slots: list, contenders: int) -> list:
+    errors = []
+    for slot in slots:
+        doc = await appointment_collection.find_one({"_id": slot["_id"]}, {"patient_id": 1, "doctor_id": 1})
+        body = {"patient_id": str(doc["patient_id"]), "appointment_id": str(slot["_id"]),
+                "diagnosis": "Przeziębienie", "recommendations": ["Odpoczynek"], "treatment_notes": "Bez powikłań"}
+        doctor = {"_id": doc["doctor_id"], "role": "doctor"}
+        responses = await asyncio.gather(*(
+            http.post("/doctor/add-history", json=body, headers=auth(doctor)) for _ in range(contenders)
+        ))
+        done = [r for r in responses if r.status_code == 200]
+        if len(done) != 1:
+            errors.append(f"wizyta {slot['_id']}: {len(done)} udanych zakończeń")
+    return errors
+
+
+async def check_invariants(slot_ids: list) -> list:
+    errors = []
+    appointments = await appointment_collection.find({"_id": {"$in": slot_ids}}).to_list(None)
+    histories = Counter(
+        doc["appointment_id"]
+        async for doc in medical_history_collection.find({"appointment_id": {"$in": slot_ids}}, {"appointment_id": 1})
+    )
+    for appt in appointments:
+        count = histories.get(appt["_id"], 0)
+        if appt["status"] == "completed" and count != 1:
+            errors.append(f"wizyta {appt['_id']}: zakończona z {count} wpisami historii")
+        if appt["status"] != "completed" and count:
+            errors.append(f"wizyta {appt['_id']}: status {appt['status']}, ale {count} wpisów historii")
+        if appt["status"] == "booked" and appt.get("patient_id") is None:
+            errors.append(f"wizyta {appt['_id']}: zarezerwowana bez pacjenta")
+        if appt["status"] == "available" and appt.get("patient_id") is not None:
+            errors.append(f"wizyta {appt['_id']}: wolna, ale z przypisanym pacjentem")
+    return errors
+
+
+async def main(args) -> int:
+    await init_db()
+    # seed() zaczyna grafik 30 dni wstecz - 3200 slotów po 15 min sięga ok. 3 dni w przyszłość
+    data = await seed(doctors=2, patients=max(args.contenders, 5), slots_per_doctor=3200, histories_per_patient=0)
+    horizon = datetime.utcnow() + timedelta(days=2)
+    free = [s for s in data["slots"] if s["status"] == "available" and s["start_time"] > horizon][:args.rounds * 3]
+    if len(free) < args.rounds * 3:
+        print("Za mało wolnych slotów w przyszłości - zmniejsz --rounds")
+        return 1
+
+    booking, rebooking, completing = free[:args.rounds], free[args.rounds:2 * args.rounds], free[2 * args.rounds:]
+    errors = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://concurrency") as http:
+        errors += await race_booking(http, booking, data["patients"], args.contenders)
+        await race_booking(http, rebooking + completing, data["patients"], 1)
+        errors += await race_cancel_and_rebook(http, rebooking, data["patients"])
+        errors += await race_completion(http, completing, args.contenders)
+
+    errors += await check_invariants([s["_id"] for s in free])
+    for error in errors:
+        print(f"BŁĄD: {error}")
+    print(f"Sprawdzono {len(free)} slotów, naruszeń: {len(errors)}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--contenders", type=int, default=10)
+    sys.exit(asyncio.run(main(parser.parse_args())))
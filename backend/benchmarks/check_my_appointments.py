@@ -0,0 +1,78 @@
+"""Sprawdza liczbę komend MongoDB wykonywanych przez /user/my-appointments.
+
+Wymaga lokalnej bazy MongoDB (MONGO_DETAILS). Dla każdej liczby wpisów
+historii N zasiewa osobną bazę pacjentem z N zakończonymi wizytami, odpytuje
+endpoint i odczytuje liczbę komend z histogramu MongoMetricsListener. Liczba
+komend nie może zależeć od N: lista wizyt i ich historia to 2 komendy, a z
+include_history=true dochodzi odczyt archiwum (3). Przy naruszeniu skrypt
+wypisuje wykonane zapytania i kończy się kodem 1:
+
+    python -m benchmarks.check_my_appointments --histories 1,10,100
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+os.environ["QUERY_AUDIT"] = "1"
+os.environ.setdefault("MONGO_DB_NAME", "medical_app_commands")
+os.environ.setdefault("SECRET_KEY", "temporary_dev_secret_key_123")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+import httpx  # noqa: E402
+
+from app.database import init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.middleware.metrics import metrics  # noqa: E402
+from app.query_audit import query_recorder  # noqa: E402
+from benchmarks.seed import seed, token_for  # noqa: E402
+
+ROUTE = ("GET", "/user/my-appointments")
+# Wizyty (+ archiwum przy include_history) i jedno zapytanie o historię dla wszystkich
+EXPECTED_COMMANDS = {"": 2, "?include_history=true": 3}
+
+
+async def request(http, patient: dict, query: str, histories: int) -> float | None:
+    metrics.reset()
+    query_recorder.clear()
+    response = await http.get(f"/user/my-appointments{query}",
+                              headers={"Authorization": f"Bearer {token_for(patient)}"})
+    appointments = response.json() if response.status_code == 200 else []
+    with_history = sum(1 for appt in appointments if appt.get("medical_history"))
+    commands = metrics.commands_per_request().get(ROUTE, (0, 0))[0]
+
+    ok = response.status_code == 200 and with_history == histories and commands == EXPECTED_COMMANDS[query]
+    print(f"N={histories:<5} {query or '(domyślnie)':<22} {response.status_code} wizyt {len(appointments):4} "
+          f"z historią {with_history:4} komend {commands:.0f} {'OK' if ok else 'BŁĄD'}")
+    if not ok:
+        for database_name, command in query_recorder.commands:
+            print(f"    {database_name}: {command}")
+    return commands if ok else None
+
+
+async def main(args) -> int:
+    await init_db()
+    counts = {query: set() for query in EXPECTED_COMMANDS}
+    failed = False
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://commands") as http:
+        for histories in args.histories:
+            # Jeden pacjent i jeden lekarz - wszystkie wylosowane sloty z przeszłości trafiają do historii
+            data = await seed(doctors=1, patients=1, slots_per_doctor=histories + 200, histories_per_patient=histories)
+            for query in EXPECTED_COMMANDS:
+                commands = await request(http, data["patients"][0], query, histories)
+                failed = failed or commands is None
+                counts[query].add(commands)
+
+    for query, values in counts.items():
+        if len(values) > 1:
+            print(f"Liczba komend dla {query or '(domyślnie)'} zależy od N: {sorted(v for v in values if v is not None)}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    # Endpoint zwraca najwyżej 100 wizyt - powyżej tej liczby nie wszystkie wpisy historii są widoczne
+    parser.add_argument("--histories", type=lambda value: [int(n) for n in value.split(",")], default=[1, 10, 100])
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,62 @@
+"""Sprawdza plany wszystkich zapytań wykonywanych przez endpointy.
+
+Wymaga lokalnej bazy MongoDB z replica setem (MONGO_DETAILS). Uruchamia
+aplikację w trybie QUERY_AUDIT=1 na osobnej bazie, wywołuje raz każdą trasę
+z benchmarks.bench_routes (odczyty, logowanie, rezerwacje, zmiany grafiku,
+wyszukiwanie, analityka), a następnie wykonuje explain() dla każdego
+zarejestrowanego zapytania. Kończy się kodem 1, jeśli którekolwiek z nich to
+COLLSCAN albo trasa zwróciła błąd 5xx:
+
+    python -m benchmarks.check_query_plans
+"""
+import asyncio
+import os
+import sys
+
+os.environ["QUERY_AUDIT"] = "1"
+os.environ.setdefault("MONGO_DB_NAME", "medical_app_audit")
+os.environ.setdefault("SECRET_KEY", "temporary_dev_secret_key_123")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+import httpx  # noqa: E402
+
+# Przed app - bench_routes ustawia zmienne środowiska (limity logowania, BCRYPT_ROUNDS, zadania w tle)
+from benchmarks.bench_routes import SKIPPED, prepare_pools, route_cases  # noqa: E402
+from app.database import get_client, init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.query_audit import find_collection_scans, query_recorder  # noqa: E402
+from benchmarks.seed import seed  # noqa: E402
+
+
+async def main() -> int:
+    await init_db()
+    # Trasy zmieniające stan potrzebują przyszłych slotów - jak w bench_routes
+    data = await seed(slots_per_doctor=3200)
+    pools = await prepare_pools(data, 1)
+    for route, reason in SKIPPED.items():
+        print(f"{route} pominięto ({reason})")
+
+    failed = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        query_recorder.clear()
+        async with httpx.AsyncClient(transport=transport, base_url="http://audit", timeout=60) as http:
+            for route, factory in route_cases(data, pools):
+                method, url, token, kwargs = factory(0)
+                headers = {"Authorization": f"Bearer {token}"} if token else {}
+                response = await http.request(method, url, headers=headers, **kwargs)
+                print(f"{response.status_code} {route}")
+                if response.status_code >= 500:
+                    failed.append(route)
+
+    offenders = await find_collection_scans(get_client())
+    for command in offenders:
+        print(f"COLLSCAN: {command}")
+    for route in failed:
+        print(f"BŁĄD 5xx: {route}")
+    print(f"Sprawdzono {len(query_recorder.commands)} zapytań, COLLSCAN: {len(offenders)}")
+    return 1 if offenders or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,76 @@
+"""Generowanie danych testowych bezpośrednio w MongoDB (bez bcrypt i bez API)."""
+import random
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.auth.security import create_access_token, hash_password
+from app.doctor_search import search_fields
+from app.database import appointment_collection, medical_history_collection, user_collection
+
+
+def token_for(user: dict) -> str:
+    return create_access_token(data={
+        "sub": str(user["_id"]),
+        "role": user["role"],
+        "is_active": user.get("is_active", True),
+    })
+
+
+async def seed(doctors: int = 5, patients: int = 20, slots_per_doctor: int = 200,
+               histories_per_patient: int = 3, seed_value: int = 42) -> dict:
+    rng = random.Random(seed_value)
+    await user_collection.delete_many({})
+    await appointment_collection.delete_many({})
+    await medical_history_collection.delete_many({})
+
+    # Jeden hash dla wszystkich kont - koszt bcrypt nie jest tu przedmiotem pomiaru
+    hashed = hash_password("haslo12345", rounds=4)
+
+    def user(role, i):
+        return {"_id": ObjectId(), "email": f"{role}{i}@example.com", "hashed_password": hashed,
+                "role": role, "full_name": f"{role.title()} {i}", "is_active": True}
+
+    admin = user("admin", 0)
+    doctor_docs = [user("doctor", i) for i in range(doctors)]
+    for doctor in doctor_docs:
+        doctor.update(search_fields(doctor["full_name"], doctor["email"]))
+    patient_docs = [user("patient", i) for i in range(patients)]
+    await user_collection.insert_many([admin, *doctor_docs, *patient_docs])
+
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    start = now - timedelta(days=30)
+    slots = []
+    for doctor in doctor_docs:
+        for i in range(slots_per_doctor):
+            slot_start = start + timedelta(minutes=15 * i)
+            slots.append({"_id": ObjectId(), "doctor_id": doctor["_id"], "start_time": slot_start,
+                          "end_time": slot_start + timedelta(minutes=15), "status": "available",
+                          "patient_id": None, "created_at": now})
+
+    histories = []
+    past = [slot for slot in slots if slot["start_time"] < now]
+    future = [slot for slot in slots if slot["start_time"] >= now + timedelta(days=2)]
+    for patient in patient_docs:
+        for slot in rng.sample(past, min(histories_per_patient, len(past))):
+            if slot["status"] != "available":
+                continue
+            slot.update(status="completed", patient_id=patient["_id"],
+                        details={"reason_for_visit": "Kontrola okresowa", "previous_treatment": False})
+            histories.append({"_id": ObjectId(), "patient_id": patient["_id"], "doctor_id": slot["doctor_id"],
+                              "appointment_id": slot["_id"], "diagnosis": "Przeziębienie",
+                              "recommendations": ["Odpoczynek"], "treatment_notes": "Bez powikłań",
+                              "date": slot["start_time"]})
+        if future:
+            slot = rng.choice(future)
+            if slot["status"] == "available":
+                slot.update(status="booked", patient_id=patient["_id"],
+                            details={"reason_for_visit": "Konsultacja", "previous_treatment": False})
+
+    if slots:
+        await appointment_collection.insert_many(slots, ordered=False)
+    if histories:
+        await medical_history_collection.insert_many(histories, ordered=False)
+
+    return {"admin": admin, "doctors": doctor_docs, "patients": patient_docs,
+            "slots": slots, "histories": histories}
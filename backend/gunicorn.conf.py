@@ -0,0 +1,46 @@
+# Tryb produkcyjny: gunicorn app.main:app -c gunicorn.conf.py
+import multiprocessing
+import os
+import tempfile
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Aplikacja importowana raz w masterze; klient Mongo, cache i pule są tworzone
+# w każdym workerze osobno (app.workers.reset_process_state po fork()).
+# Stan w pamięci procesu NIE jest współdzielony między workerami:
+#  * unieważnienie sesji (invalidate_principal) działa tylko w workerze, który obsłużył zmianę -
+#    pozostałe ufają rolom z tokenu do jego wygaśnięcia (ACCESS_TOKEN_EXPIRE_MINUTES),
+#  * cache odpowiedzi może w innych workerach zwracać stare dane przez RESPONSE_CACHE_TTL_SECONDS,
+#  * limity logowania/rejestracji są liczone osobno - efektywny limit to LOGIN_* x WEB_CONCURRENCY.
+preload_app = os.getenv("PRELOAD_APP", "1") == "1"
+
+# /metrics sumuje liczniki wszystkich workerów (prometheus_client w trybie wieloprocesowym).
+# Ustawiane przed importem aplikacji; nowy katalog przy każdym starcie mastera.
+if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+keepalive = int(os.getenv("KEEPALIVE", 5))
+max_requests = int(os.getenv("MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", 0))
+
+accesslog = os.getenv("ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):
+    server.log.info("Worker %s uruchomiony", worker.pid)
+
+
+def worker_int(worker):
+    worker.log.info("Worker %s kończy obsługę żądań", worker.pid)
+
+
+def child_exit(server, worker):
+    # Gauge'y zakończonego workera nie powinny dalej wliczać się do sum
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)